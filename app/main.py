@@ -9,26 +9,34 @@ import os
 import logging
 from fastapi import FastAPI, Request, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from datetime import datetime
+from fastapi.responses import ORJSONResponse
+from datetime import datetime, timezone
 
 from .routers.webhooks import router as webhook_router
 from .models.schemas import HealthResponse
 from .utils.config import get_config
+from .services.email_sender import get_http_client, close_http_client
+from .services.anthropic_client import close_anthropic_client
+from .services.warmup import warm_caches
+from .services.task_queue import open_queue, close_queue
 
-# Configure logging
+# Configure logging (set LOG_LEVEL=WARNING in production to skip per-email info lines)
 logging.basicConfig(
-    level=logging.INFO,
+    level=os.environ.get("LOG_LEVEL", "INFO").upper(),
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 logger = logging.getLogger(__name__)
 
+# Per-request access lines duplicate our own webhook logging
+logging.getLogger("uvicorn.access").setLevel(logging.WARNING)
+
 # Create FastAPI app
 app = FastAPI(
     title="AI Email Router",
     description="AI-powered email classification and routing system",
     version="1.0.0",
-    docs_url="/docs"
+    docs_url="/docs",
+    default_response_class=ORJSONResponse
 )
 
 # Add CORS middleware for production
@@ -43,18 +51,36 @@ app.add_middleware(
 # Include routers
 app.include_router(webhook_router, prefix="/webhooks")
 
-@app.get("/", response_model=dict)
+@app.on_event("startup")
+async def open_http_clients():
+    """Open the Mailgun client and the task queue before the first request."""
+    get_http_client()
+    await open_queue()
+
+@app.on_event("startup")
+async def preload_clients():
+    """Parse all client configurations and templates once and warm Anthropic connections."""
+    await warm_caches()
+
+@app.on_event("shutdown")
+async def close_http_clients():
+    """Close pooled HTTP clients."""
+    await close_http_client()
+    await close_anthropic_client()
+    await close_queue()
+
+@app.get("/")
 async def root():
     """Root endpoint for health check."""
-    return {
+    return ORJSONResponse({
         "service": "AI Email Router",
         "status": "active",
         "docs": "/docs",
         "health": "/health",
         "webhook": "/webhooks/mailgun/inbound"
-    }
+    })
 
-@app.get("/health", response_model=HealthResponse)
+@app.get("/health")
 async def health_check():
     """Health check endpoint for Cloud Run."""
     try:
@@ -66,9 +92,10 @@ async def health_check():
         # Test email service  
         email_status = "configured" if config.mailgun_api_key and config.mailgun_domain else "missing_credentials"
         
-        return HealthResponse(
+        # Server-generated data: construct without running field validators
+        health = HealthResponse.model_construct(
             status="healthy",
-            timestamp=datetime.utcnow(),
+            timestamp=datetime.now(timezone.utc),
             version="1.0.0",
             components={
                 "api": "healthy",
@@ -77,6 +104,8 @@ async def health_check():
                 "webhook_endpoint": "active"
             }
         )
+        
+        return ORJSONResponse(health.model_dump(mode="json"))
     except Exception as e:
         logger.error(f"Health check failed: {e}")
         raise HTTPException(status_code=503, detail="Service unavailable")
@@ -85,7 +114,7 @@ async def health_check():
 async def global_exception_handler(request: Request, exc: Exception):
     """Global exception handler."""
     logger.error(f"Unhandled exception: {exc}")
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=500,
         content={"error": "Internal server error", "detail": str(exc)}
     )
@@ -93,4 +122,13 @@ async def global_exception_handler(request: Request, exc: Exception):
 if __name__ == "__main__":
     import uvicorn
     port = int(os.environ.get("PORT", 8080))  # Cloud Run uses PORT env var
-    uvicorn.run("app.main:app", host="0.0.0.0", port=port) 
\ No newline at end of file
+    workers = int(os.environ.get("WEB_CONCURRENCY", os.cpu_count() or 1))
+    uvicorn.run(
+        "app.main:app",
+        host="0.0.0.0",
+        port=port,
+        loop="uvloop",
+        http="httptools",
+        workers=workers,
+        access_log=False
+    ) 
\ No newline at end of file
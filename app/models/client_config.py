@@ -3,10 +3,15 @@ Pydantic models for client configuration validation.
 🏗️ Defines schemas for YAML configuration files.
 """
 
+import re
 from datetime import datetime
 from enum import Enum
 from typing import Dict, List, Optional, Union, Any
-from pydantic import BaseModel, Field, EmailStr, validator, field_validator
+from pydantic import BaseModel, Field, EmailStr, PrivateAttr, validator, field_validator
+
+# Precompiled patterns for field validators
+_CLIENT_ID_RE = re.compile(r'client-[A-Za-z0-9_-]*')
+_HEX_COLOR_RE = re.compile(r'#[0-9a-fA-F]{6}')
 
 
 class ClientStatus(str, Enum):
@@ -38,9 +43,9 @@ class ClientInfo(BaseModel):
     @classmethod
     def validate_client_id(cls, v: str) -> str:
         """Validate client ID format."""
-        if not v.startswith('client-'):
-            raise ValueError('Client ID must start with "client-"')
-        if not v.replace('-', '').replace('_', '').isalnum():
+        if not _CLIENT_ID_RE.fullmatch(v):
+            if not v.startswith('client-'):
+                raise ValueError('Client ID must start with "client-"')
             raise ValueError('Client ID must contain only alphanumeric characters, hyphens, and underscores')
         return v
 
@@ -63,11 +68,7 @@ class BrandingConfig(BaseModel):
     @classmethod  
     def validate_hex_color(cls, v: str) -> str:
         """Validate hex color format."""
-        if not v.startswith('#') or len(v) != 7:
-            raise ValueError('Color must be a valid hex color (e.g., #667eea)')
-        try:
-            int(v[1:], 16)  # Try to parse as hex
-        except ValueError:
+        if not _HEX_COLOR_RE.fullmatch(v):
             raise ValueError('Color must be a valid hex color (e.g., #667eea)')
         return v
 
@@ -78,6 +79,12 @@ class ResponseTimeConfig(BaseModel):
     billing: str = Field(..., description="Billing response time")
     sales: str = Field(..., description="Sales response time")  
     general: str = Field(..., description="General response time")
+    
+    def for_category(self, category: str) -> str:
+        """Get the response time for a category, falling back to general."""
+        if category in ResponseTimeConfig.model_fields:
+            return getattr(self, category)
+        return self.general
 
 
 class ContactsConfig(BaseModel):
@@ -94,6 +101,7 @@ class SettingsConfig(BaseModel):
     ai_classification_enabled: bool = Field(default=True, description="Use AI for classification")
     escalation_enabled: bool = Field(default=True, description="Auto-escalate based on rules")
     monitoring_enabled: bool = Field(default=True, description="Enable monitoring/analytics")
+    claude_latency_optimized: bool = Field(default=True, description="Use priority capacity for Claude classification")
 
 
 class ClientConfig(BaseModel):
@@ -148,6 +156,24 @@ class RoutingRules(BaseModel):
     escalation: Optional[EscalationConfig] = None
     backup_routing: Optional[Dict[str, EmailStr]] = None
     special_rules: Optional[SpecialRules] = None
+    
+    # Category -> destination lookup, precomputed once at load time
+    _routing_flat: Dict[str, str] = PrivateAttr(default_factory=dict)
+    
+    def model_post_init(self, __context: Any) -> None:
+        """Flatten primary and backup routing into a single lookup table."""
+        flat = {category: str(email) for category, email in (self.backup_routing or {}).items()}
+        flat.update({category: str(email) for category, email in self.routing.items()})
+        self._routing_flat = flat
+    
+    @property
+    def has_special_routing(self) -> bool:
+        """Whether routing depends on more than the email category."""
+        return bool(self.special_rules) or bool(self.escalation and self.escalation.keyword_based)
+    
+    def route_for(self, category: str) -> Optional[str]:
+        """Get the destination for a category, falling back to general."""
+        return self._routing_flat.get(category) or self._routing_flat.get('general')
 
 
 # Category Models
@@ -2,7 +2,7 @@
 Pydantic models for request/response schemas.
 """
 
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict, Field
 from datetime import datetime
 from typing import Dict, List, Optional
 
@@ -19,6 +19,15 @@ class EmailClassificationRequest(BaseModel):
     body: str
     sender: Optional[str] = None
 
+class TestEmailPayload(BaseModel):
+    """Test webhook payload."""
+    model_config = ConfigDict(populate_by_name=True)
+    
+    from_: str = Field("test@example.com", alias="from")
+    to: str = "support@colenielson.dev"
+    subject: str = "Test Email"
+    body: str = "This is a test email."
+
 class EmailClassificationResponse(BaseModel):
     """Email classification response."""
     category: str
@@ -3,19 +3,45 @@ Webhook handlers for incoming emails with multi-tenant support.
 🎯 CORE MVP ENDPOINT: /webhooks/mailgun/inbound
 """
 
+import asyncio
 import logging
+import sys
 from fastapi import APIRouter, Request, BackgroundTasks, Depends
-from typing import Optional
+from fastapi.responses import ORJSONResponse
+from typing import Mapping, Optional, Union
+from urllib.parse import parse_qsl
 
-from ..services.dynamic_classifier import DynamicClassifier, get_dynamic_classifier
+from ..services.dynamic_classifier import DynamicClassifier, get_dynamic_classifier, get_classification_stats
 from ..services.client_manager import ClientManager, get_client_manager
 from ..services.routing_engine import RoutingEngine, get_routing_engine
-from ..services.email_composer import generate_customer_acknowledgment, generate_team_analysis
+from ..services.email_composer import (
+    generate_customer_acknowledgment, generate_email_responses, generate_team_analysis
+)
 from ..services.email_sender import send_auto_reply, forward_to_team
+from ..services.task_queue import enqueue_email
+from ..utils.config import get_config
+from ..utils.responses import orjson_response
+from ..utils.form_parser import parse_multipart_fields
+from ..models.schemas import TestEmailPayload
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
+# Caps in-process pipelines per event loop; queued emails wait for a slot
+_pipeline_semaphore: Optional[asyncio.Semaphore] = None
+_pipeline_semaphore_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def _get_pipeline_semaphore() -> Optional[asyncio.Semaphore]:
+    """Get the in-process pipeline concurrency limit for the running loop (None when unbounded)."""
+    global _pipeline_semaphore, _pipeline_semaphore_loop
+    loop = asyncio.get_running_loop()
+    if loop is not _pipeline_semaphore_loop:
+        limit = get_config().pipeline_max_concurrency
+        _pipeline_semaphore = asyncio.Semaphore(limit) if limit > 0 else None
+        _pipeline_semaphore_loop = loop
+    return _pipeline_semaphore
+
 
 @router.post("/mailgun/inbound")
 async def mailgun_inbound_webhook(
@@ -36,110 +62,238 @@ async def mailgun_inbound_webhook(
     5. Generate personalized auto-reply with client branding
     6. Send auto-reply to customer
     7. Forward with analysis to team member
+    
+    Only the request body is read before acknowledging, so Mailgun gets its
+    200 quickly; form parsing and client identification run in the background.
+    """
+    try:
+        form_data = await _read_form(request)
+        
+        background_tasks.add_task(
+            ingest_email,
+            form_data,
+            dynamic_classifier,
+            client_manager,
+            routing_engine
+        )
+        
+        # Fixed-shape acknowledgment: serialize directly, skipping jsonable_encoder
+        return ORJSONResponse({"status": "received", "message": "Email processing started"})
+        
+    except Exception as e:
+        logger.error(f"❌ Webhook processing failed: {e}")
+        return ORJSONResponse({"status": "error", "message": str(e)})
+
+
+# Mailgun fields read by the inbound webhook
+MAILGUN_INBOUND_FIELDS = frozenset({
+    "from", "recipient", "subject", "body-plain", "stripped-text", "timestamp", "Message-Id"
+})
+
+
+async def _read_form(request: Request) -> Union[bytes, Mapping[str, str]]:
+    """
+    Read webhook form fields, deferring urlencoded parsing.
+    
+    Mailgun posts urlencoded forms unless attachments are present; those are
+    returned as the raw body and parsed later by ingest_email. Multipart bodies
+    are streamed and only the fields the webhook reads are kept, so attachments
+    are never buffered.
+    
+    Args:
+        request: Incoming webhook request
+        
+    Returns:
+        Raw urlencoded body, or mapping of form field names to values
+    """
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith("application/x-www-form-urlencoded"):
+        return await request.body()
+    
+    if content_type.startswith("multipart/form-data"):
+        return await parse_multipart_fields(request, MAILGUN_INBOUND_FIELDS)
+    
+    return await request.form()
+
+
+async def ingest_email(form_data: Union[bytes, Mapping[str, str]],
+                       dynamic_classifier,
+                       client_manager,
+                       routing_engine):
+    """
+    🔄 Background task: Parse an acknowledged webhook, identify the client and process it
+    
+    Args:
+        form_data: Raw urlencoded body or parsed form fields from _read_form
     """
     try:
-        # Extract email data from Mailgun webhook
-        form_data = await request.form()
+        if isinstance(form_data, bytes):
+            form_data = dict(parse_qsl(form_data.decode("latin-1"), keep_blank_values=True))
         
+        # body-html is not used downstream, so it is not carried through the pipeline.
+        # Recipients repeat across emails, so they are interned for cheap lookups.
         email_data = {
             "from": form_data.get("from", "unknown@domain.com"),
-            "to": form_data.get("recipient", ""),
+            "to": sys.intern(form_data.get("recipient", "")),
             "subject": form_data.get("subject", "No Subject"),
             "body_text": form_data.get("body-plain", ""),
-            "body_html": form_data.get("body-html", ""),
             "stripped_text": form_data.get("stripped-text", ""),
             "timestamp": form_data.get("timestamp", ""),
             "message_id": form_data.get("Message-Id", ""),
         }
-        
-        logger.info(f"📧 Received email from {email_data['from']}: {email_data['subject']}")
-        
-        # Identify client from recipient domain
-        identification_result = client_manager.identify_client_by_email(email_data['to'])
-        client_id = identification_result.client_id if identification_result.is_successful else None
-        
-        if client_id:
-            logger.info(f"🎯 Identified client: {client_id} (confidence: {identification_result.confidence:.2f}, method: {identification_result.method})")
-        else:
-            logger.warning(f"⚠️ No client identified for recipient: {email_data['to']}")
-        
-        # Process email in background (non-blocking)
-        background_tasks.add_task(
-            process_email_pipeline, 
-            email_data, 
+    except Exception as e:
+        logger.error(f"❌ Failed to parse webhook form: {e}")
+        return
+    
+    logger.info("📧 Received email from %s: %s", email_data['from'], email_data['subject'])
+    
+    # Identify client from recipient domain
+    identification_result = client_manager.identify_client_by_email(email_data['to'])
+    client_id = identification_result.client_id if identification_result.is_successful else None
+    
+    if client_id:
+        logger.info("🎯 Identified client: %s (confidence: %.2f, method: %s)",
+                    client_id, identification_result.confidence, identification_result.method)
+    else:
+        logger.warning("⚠️ No client identified for recipient: %s", email_data['to'])
+    
+    # Hand off to a queue worker if configured, otherwise process here
+    if not await enqueue_email(email_data, client_id):
+        await run_email_pipeline(
+            email_data,
             client_id,
             dynamic_classifier,
             client_manager,
             routing_engine
         )
-        
-        return {"status": "received", "message": "Email processing started", "client_id": client_id}
-        
-    except Exception as e:
-        logger.error(f"❌ Webhook processing failed: {e}")
-        return {"status": "error", "message": str(e)}
+
+
+async def run_email_pipeline(email_data: dict, client_id: Optional[str],
+                             dynamic_classifier,
+                             client_manager,
+                             routing_engine):
+    """
+    🔄 Background task: Process an email in-process within the pipeline concurrency limit
+    
+    A burst of webhooks is acknowledged at once, but only PIPELINE_MAX_CONCURRENCY
+    emails are classified, acknowledged and sent at a time; the rest wait instead of
+    piling requests onto the Anthropic connection pool. Team analysis that may wait
+    on a message batch runs outside the limit so it never holds a slot.
+    """
+    await process_email_pipeline(email_data, client_id, dynamic_classifier, client_manager, routing_engine,
+                                 slot=_get_pipeline_semaphore())
+
+
+async def _in_slot(slot: Optional[asyncio.Semaphore], awaitable):
+    """Await a latency-sensitive pipeline step while holding a concurrency slot, if any."""
+    if slot is None:
+        return await awaitable
+    async with slot:
+        return await awaitable
 
 
 async def process_email_pipeline(email_data: dict, client_id: Optional[str],
                                dynamic_classifier,
                                client_manager,
-                               routing_engine):
+                               routing_engine,
+                               slot: Optional[asyncio.Semaphore] = None):
     """
     🔄 Background task: Complete multi-tenant email processing pipeline
+    
+    When slot is given, classification, the acknowledgment and the sends each hold
+    it; team analysis is generated without it.
     """
     try:
-        logger.info(f"🤖 Processing email for client {client_id or 'unknown'}: {email_data['subject']}")
+        logger.info("🤖 Processing email for client %s: %s", client_id or 'unknown', email_data['subject'])
         
         # Step 1: AI Classification with client-specific prompts
-        classification = await dynamic_classifier.classify_email(email_data, client_id)
+        classification = await _in_slot(slot, dynamic_classifier.classify_email(email_data, client_id))
         
         category = classification.get('category', 'general')
         confidence = classification.get('confidence', 0.0)
         method = classification.get('method', 'unknown')
         
-        logger.info(f"📋 Classification: {category} ({confidence:.2f}, {method})")
+        logger.info("📋 Classification: %s (%.2f, %s)", category, confidence, method)
         
         # Step 2: Routing with client-specific rules
-        if client_id:
+        simple_destination = None
+        if client_id and confidence >= 0.3:
+            try:
+                routing_rules = client_manager.get_routing_rules(client_id)
+                if not routing_rules.has_special_routing:
+                    # Plain category routing: a single lookup in the precomputed table
+                    simple_destination = routing_rules.route_for(category)
+            except Exception as e:
+                logger.warning(f"Fast routing lookup failed for {client_id}: {e}")
+        
+        if simple_destination:
+            forward_to = simple_destination
+            logger.info("📍 Routing: %s → %s", category, forward_to)
+        elif client_id:
             routing_result = routing_engine.route_email(client_id, classification, email_data)
             forward_to = routing_result['primary_destination']
             
-            logger.info(f"📍 Routing: {category} → {forward_to}")
+            logger.info("📍 Routing: %s → %s", category, forward_to)
             
             # Log special handling if any
             special_handling = routing_result.get('special_handling', [])
             if special_handling:
-                logger.info(f"🚨 Special handling: {', '.join(special_handling)}")
+                logger.info("🚨 Special handling: %s", ', '.join(special_handling))
         else:
             # Fallback routing when no client identified
             forward_to = "admin@example.com"  # TODO: Make this configurable
             logger.warning("Using fallback routing for unknown client")
         
-        # Step 3: Generate customer acknowledgment with client branding
-        customer_acknowledgment = await generate_customer_acknowledgment(
-            email_data, classification, client_id
-        )
-        
-        # Step 4: Generate team analysis with client context
-        team_analysis = await generate_team_analysis(
-            email_data, classification, client_id
-        )
+        # Branches the client has switched off are skipped before any text is generated
+        auto_reply_enabled = team_forwarding_enabled = True
+        client_config = client_manager.get_client_config_optional(client_id) if client_id else None
+        if client_config is not None:
+            auto_reply_enabled = client_config.settings.auto_reply_enabled
+            team_forwarding_enabled = client_config.settings.team_forwarding_enabled
         
-        # Step 5: Send customer acknowledgment with client branding
-        await send_auto_reply(email_data, classification, customer_acknowledgment, client_id)
+        # Steps 3-6: Generate and send the auto-reply and the team forward concurrently
+        if get_config().composer_single_call and auto_reply_enabled and team_forwarding_enabled:
+            customer_acknowledgment, team_analysis = await _in_slot(
+                slot, generate_email_responses(email_data, classification, client_id)
+            )
+            sends = {
+                'auto_reply': _in_slot(
+                    slot, send_auto_reply(email_data, classification, customer_acknowledgment, client_id)
+                ),
+                'team_forward': _in_slot(
+                    slot, forward_to_team(email_data, forward_to, classification, team_analysis, client_id)
+                )
+            }
+        else:
+            # Each branch sends as soon as its own text is ready, so the auto-reply
+            # never waits for a team analysis held in a message batch
+            sends = {}
+            if auto_reply_enabled:
+                sends['auto_reply'] = _in_slot(slot, _send_acknowledgment(email_data, classification, client_id))
+            else:
+                logger.info("Auto-reply disabled for client %s, skipping acknowledgment", client_id)
+            if team_forwarding_enabled:
+                sends['team_forward'] = _forward_team_analysis(email_data, forward_to, classification, client_id, slot)
+            else:
+                logger.info("Team forwarding disabled for client %s, skipping team analysis", client_id)
+        send_results = await asyncio.gather(*sends.values(), return_exceptions=True)
+        for branch, result in zip(sends, send_results):
+            if isinstance(result, Exception):
+                logger.error(f"❌ {branch} failed: {result}")
         
-        # Step 6: Forward to team with detailed analysis
-        await forward_to_team(email_data, forward_to, classification, team_analysis, client_id)
+        # Surface the first failure so the admin gets notified
+        for result in send_results:
+            if isinstance(result, Exception):
+                raise result
         
         # Log successful completion
-        if client_id:
-            client_config = client_manager.get_client_config(client_id)
+        if client_config is not None:
             company_name = client_config.branding.company_name
-            logger.info(f"✅ Email processed for {company_name}: "
-                       f"acknowledgment sent + analysis forwarded to {forward_to}")
+            logger.info("✅ Email processed for %s: %s (team: %s)",
+                        company_name, ', '.join(sends) or 'no replies enabled', forward_to)
         else:
-            logger.info(f"✅ Email processed (no client): "
-                       f"acknowledgment sent + analysis forwarded to {forward_to}")
+            logger.info("✅ Email processed (client %s): %s (team: %s)",
+                        client_id or 'unknown', ', '.join(sends), forward_to)
         
     except Exception as e:
         logger.error(f"❌ Email pipeline failed: {e}")
@@ -158,6 +312,20 @@ async def process_email_pipeline(email_data: dict, client_id: Optional[str],
             logger.error(f"❌ Failed to send failure notification: {notification_error}")
 
 
+async def _send_acknowledgment(email_data: dict, classification: dict, client_id: Optional[str]):
+    """Generate the customer acknowledgment and send it as the auto-reply."""
+    acknowledgment = await generate_customer_acknowledgment(email_data, classification, client_id)
+    await send_auto_reply(email_data, classification, acknowledgment, client_id)
+
+
+async def _forward_team_analysis(email_data: dict, forward_to: str, classification: dict,
+                                 client_id: Optional[str], slot: Optional[asyncio.Semaphore] = None):
+    """Generate the team analysis and forward the email with it to the team."""
+    # The analysis may wait on a message batch, so only the send holds a pipeline slot
+    analysis = await generate_team_analysis(email_data, classification, client_id)
+    await _in_slot(slot, forward_to_team(email_data, forward_to, classification, analysis, client_id))
+
+
 async def _send_failure_notification(email_data: dict, error_message: str, admin_email: str):
     """
     Send notification about email processing failure.
@@ -236,12 +404,13 @@ async def webhook_status(client_manager = Depends(get_client_manager)):
                     'error': str(e)
                 })
         
-        return {
+        return await orjson_response({
             "status": "active",
             "webhook_endpoint": "/webhooks/mailgun/inbound",
             "total_clients": len(available_clients),
-            "clients": client_details
-        }
+            "clients": client_details,
+            "classification": get_classification_stats()
+        })
         
     except Exception as e:
         logger.error(f"Failed to get webhook status: {e}")
@@ -259,17 +428,16 @@ async def test_webhook(request: Request, background_tasks: BackgroundTasks,
     Accepts JSON payload with test email data.
     """
     try:
-        # Get JSON data instead of form data for testing
-        test_data = await request.json()
+        # Parse and validate the JSON body in one pass
+        payload = TestEmailPayload.model_validate_json(await request.body())
         
         # Convert to expected format
         email_data = {
-            "from": test_data.get("from", "test@example.com"),
-            "to": test_data.get("to", "support@colenielson.dev"),
-            "subject": test_data.get("subject", "Test Email"),
-            "body_text": test_data.get("body", "This is a test email."),
-            "body_html": "",
-            "stripped_text": test_data.get("body", "This is a test email."),
+            "from": payload.from_,
+            "to": payload.to,
+            "subject": payload.subject,
+            "body_text": payload.body,
+            "stripped_text": payload.body,
             "timestamp": "",
             "message_id": "test-message-id",
         }
@@ -282,7 +450,7 @@ async def test_webhook(request: Request, background_tasks: BackgroundTasks,
         
         # Process in background
         background_tasks.add_task(
-            process_email_pipeline, 
+            run_email_pipeline,
             email_data, 
             client_id,
             dynamic_classifier,
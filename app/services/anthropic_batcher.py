@@ -0,0 +1,306 @@
+"""
+Coalescing of Claude requests into Anthropic Message Batches.
+📦 Trades latency for throughput and batch pricing on non-interactive calls.
+"""
+
+import asyncio
+import bisect
+import logging
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import httpx
+import orjson
+
+from ..utils.config import get_config
+from .anthropic_client import (
+    RETRYABLE_STATUS_CODES, RETRYABLE_TRANSPORT_ERRORS, create_message, get_anthropic_client, message_text
+)
+
+logger = logging.getLogger(__name__)
+
+# Message Batches accept at most this many requests per batch
+MAX_REQUESTS_PER_BATCH = 10000
+
+# Upper bounds (in estimated prompt tokens) of the length buckets submitted as separate batches
+LENGTH_BUCKET_TOKENS = (1000, 4000, 16000)
+
+
+def _estimate_tokens(payload: Dict[str, Any]) -> int:
+    """Roughly estimate the prompt tokens of a Messages API request (about 4 characters per token)."""
+    system = payload.get("system")
+    chars = len(system) if isinstance(system, str) else 0
+    for message in payload.get("messages", ()):
+        content = message.get("content")
+        if isinstance(content, str):
+            chars += len(content)
+        else:
+            chars += sum(len(block.get("text", "")) for block in content or ())
+    return chars // 4
+
+
+class MessageBatchError(Exception):
+    """Raised when a request in a message batch does not succeed."""
+    pass
+
+
+class MessageBatchTimeout(MessageBatchError):
+    """Raised when a message batch is still processing at its deadline."""
+    pass
+
+
+class MessageBatcher:
+    """
+    Collects Messages API requests for a short window and submits them as one batch.
+    
+    The batch is polled until processing ends, then each caller receives the
+    text of its own result. Batches can take minutes to complete, so only
+    paths that tolerate that delay should submit here. A batch still running
+    after max_wait seconds is canceled and its requests are sent directly.
+    """
+    
+    def __init__(self, window_ms: int = 100, max_batch_size: int = 32,
+                 poll_interval: float = 1.0, max_poll_interval: float = 30.0,
+                 max_wait: float = 900.0, client: Optional[httpx.AsyncClient] = None):
+        """
+        Initialize message batcher.
+        
+        Args:
+            window_ms: How long to wait for more requests before submitting
+            max_batch_size: Maximum number of requests per batch
+            poll_interval: Initial delay between batch status checks, in seconds
+            max_poll_interval: Upper bound for the doubling poll delay, in seconds
+            max_wait: Seconds to wait for a batch before falling back to direct calls
+            client: HTTP client to use (defaults to the shared Anthropic client)
+        """
+        self.window_seconds = window_ms / 1000
+        self.max_batch_size = max(1, min(max_batch_size, MAX_REQUESTS_PER_BATCH))
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.max_wait = max_wait
+        self._client = client
+        
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._pending: List[Tuple[Dict[str, Any], asyncio.Future]] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._tasks: Set[asyncio.Task] = set()
+    
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """HTTP client used for batch requests."""
+        return self._client or get_anthropic_client()
+    
+    async def submit(self, payload: Dict[str, Any]) -> str:
+        """
+        Queue a Messages API request and wait for its batched result.
+        
+        Args:
+            payload: Messages API request body
+        
+        Returns:
+            Text of the response (all text blocks joined)
+        
+        Raises:
+            MessageBatchError: If the request errored, expired or was canceled
+        """
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            # Pending futures belong to a single event loop
+            self._loop = loop
+            self._pending = []
+            self._flush_handle = None
+        
+        future = loop.create_future()
+        self._pending.append((payload, future))
+        
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.window_seconds, self._flush)
+        
+        return await future
+    
+    def _flush(self):
+        """
+        Submit all pending requests, one batch per prompt length bucket.
+        
+        Short prompts are kept out of batches holding much longer ones so
+        they are not held back until the long requests finish processing.
+        """
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        
+        pending, self._pending = self._pending, []
+        buckets: Dict[int, List[Tuple[Dict[str, Any], asyncio.Future]]] = {}
+        for item in pending:
+            bucket = bisect.bisect_left(LENGTH_BUCKET_TOKENS, _estimate_tokens(item[0]))
+            buckets.setdefault(bucket, []).append(item)
+        
+        # Buckets are submitted and polled concurrently
+        for batch in buckets.values():
+            task = self._loop.create_task(self._run_batch(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+    
+    async def _run_batch(self, batch: List[Tuple[Dict[str, Any], asyncio.Future]]):
+        """
+        Submit a batch, wait for it to end and resolve each caller's future.
+        
+        Args:
+            batch: List of (payload, future) pairs
+        """
+        requests = []
+        for index, (payload, _) in enumerate(batch):
+            # Priority Tier does not apply to batches
+            params = {key: value for key, value in payload.items() if key != "service_tier"}
+            requests.append({"custom_id": f"req-{index}", "params": params})
+        
+        try:
+            batch_id = await self._create_batch(requests)
+            results_url = await self._wait_for_results(batch_id)
+            results = await self._fetch_results(results_url)
+        except MessageBatchTimeout as e:
+            logger.warning("%s, sending its %d requests directly", e, len(batch))
+            await self._cancel_batch(batch_id)
+            await self._send_directly(batch)
+            return
+        except Exception as e:
+            logger.error("Message batch of %d requests failed: %s", len(batch), e)
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        
+        logger.info("📦 Message batch %s completed %d requests", batch_id, len(batch))
+        for index, (_, future) in enumerate(batch):
+            if future.done():
+                continue
+            result = results.get(f"req-{index}")
+            if result is None:
+                future.set_exception(MessageBatchError("Missing result in message batch"))
+            elif result.get("type") != "succeeded":
+                future.set_exception(MessageBatchError(f"Batched request {result.get('type')}: "
+                                                       f"{result.get('error')}"))
+            else:
+                try:
+                    future.set_result(message_text(result["message"]))
+                except ValueError as e:
+                    future.set_exception(MessageBatchError(str(e)))
+    
+    async def _create_batch(self, requests: List[Dict[str, Any]]) -> str:
+        """Create a message batch and return its ID."""
+        response = await self.client.post("/v1/messages/batches", content=orjson.dumps({"requests": requests}))
+        response.raise_for_status()
+        return orjson.loads(response.content)["id"]
+    
+    async def _wait_for_results(self, batch_id: str) -> str:
+        """
+        Poll a message batch until processing ends.
+        
+        Transient API and connection errors are logged and polled through.
+        
+        Args:
+            batch_id: Message batch ID
+        
+        Returns:
+            URL of the batch results file
+        
+        Raises:
+            MessageBatchTimeout: If the batch has not ended within max_wait seconds
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_wait
+        delay = self.poll_interval
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                raise MessageBatchTimeout(f"Message batch {batch_id} not ended after {self.max_wait:.0f}s")
+            await asyncio.sleep(min(delay, remaining))
+            delay = min(delay * 2, self.max_poll_interval)
+            
+            try:
+                response = await self.client.get(f"/v1/messages/batches/{batch_id}")
+            except RETRYABLE_TRANSPORT_ERRORS as e:
+                logger.warning("Polling message batch %s failed (%s), retrying", batch_id, e)
+                continue
+            if response.status_code in RETRYABLE_STATUS_CODES:
+                logger.warning("Polling message batch %s failed (%s), retrying", batch_id, response.status_code)
+                continue
+            response.raise_for_status()
+            status = orjson.loads(response.content)
+            
+            if status["processing_status"] == "ended":
+                return status["results_url"]
+    
+    async def _cancel_batch(self, batch_id: str):
+        """Ask the API to cancel a message batch; failures are only logged."""
+        try:
+            response = await self.client.post(f"/v1/messages/batches/{batch_id}/cancel")
+            response.raise_for_status()
+        except httpx.HTTPError as e:
+            logger.warning("Could not cancel message batch %s: %s", batch_id, e)
+    
+    async def _send_directly(self, batch: List[Tuple[Dict[str, Any], asyncio.Future]]):
+        """Resolve each caller's future with a direct Messages API call."""
+        pending = [(payload, future) for payload, future in batch if not future.done()]
+        results = await asyncio.gather(*(create_message(payload) for payload, _ in pending),
+                                       return_exceptions=True)
+        for (_, future), result in zip(pending, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+    
+    async def _fetch_results(self, results_url: str) -> Dict[str, Dict[str, Any]]:
+        """
+        Download batch results.
+        
+        Args:
+            results_url: URL of the JSONL results file
+        
+        Returns:
+            Mapping of custom_id to result object
+        """
+        response = await self.client.get(results_url)
+        response.raise_for_status()
+        
+        results = {}
+        for line in response.content.splitlines():
+            if line.strip():
+                entry = orjson.loads(line)
+                results[entry["custom_id"]] = entry["result"]
+        return results
+
+
+_batcher: Optional[MessageBatcher] = None
+
+
+def _get_batcher() -> MessageBatcher:
+    """Get the process-wide message batcher, creating it on first use."""
+    global _batcher
+    if _batcher is None:
+        config = get_config()
+        _batcher = MessageBatcher(
+            window_ms=config.anthropic_batch_window_ms,
+            max_batch_size=config.anthropic_batch_max_size,
+            max_wait=config.anthropic_batch_max_wait
+        )
+    return _batcher
+
+
+async def send_message(payload: Dict[str, Any], batch: bool = True) -> str:
+    """
+    Send a Messages API request, through a message batch when enabled.
+    
+    Args:
+        payload: Messages API request body
+        batch: Whether this call may wait for a batch (False for interactive paths)
+    
+    Returns:
+        Response text
+    """
+    if batch and get_config().anthropic_message_batches:
+        return await _get_batcher().submit(payload)
+    return await create_message(payload)
@@ -0,0 +1,510 @@
+"""
+Shared HTTP client for the Anthropic Messages API.
+🔌 One pooled connection set for classification and response composition.
+"""
+
+import asyncio
+import hashlib
+import logging
+import random
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Mapping, Optional, Tuple, Union
+
+import httpx
+import orjson
+
+from ..utils.config import get_config
+
+logger = logging.getLogger(__name__)
+
+# HTTP/2 needs the optional h2 package (httpx[http2])
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+ANTHROPIC_API_URL = "https://api.anthropic.com"
+ANTHROPIC_VERSION = "2023-06-01"
+
+# Request timeouts (408), rate limits (429), overload (529) and transient server errors are retried with backoff
+RETRYABLE_STATUS_CODES = frozenset({408, 429, 500, 502, 503, 504, 529})
+MAX_RETRIES = 3
+MAX_RETRY_DELAY = 30.0
+
+# Dropped keep-alive connections, connect timeouts and pool timeouts are retried. Refused
+# connections and DNS failures rarely clear up within the backoff, and read timeouts are
+# not retried because Claude may still be generating and a retry would pay for it twice.
+RETRYABLE_TRANSPORT_ERRORS = (httpx.RemoteProtocolError, httpx.ReadError, httpx.WriteError,
+                              httpx.ConnectTimeout, httpx.PoolTimeout)
+
+# Idle pooled connections are closed after this many seconds
+KEEPALIVE_EXPIRY = 60.0
+
+# HTTP/1.1 needs one connection per concurrent request, so startup opens several
+WARM_HTTP1_CONNECTIONS = 4
+
+
+class CacheablePrompt(str):
+    """
+    Prompt text whose leading characters are identical across requests.
+    
+    user_content() sends the first prefix_length characters as a separate
+    block marked for Anthropic prompt caching, so repeated prompts only pay
+    full price for the part that changes.
+    """
+    
+    def __new__(cls, text: str, prefix_length: int):
+        prompt = super().__new__(cls, text)
+        prompt.prefix_length = prefix_length
+        return prompt
+
+
+def user_content(prompt: str) -> Union[str, List[Dict[str, Any]]]:
+    """
+    Build the content of a user message, marking a cacheable prompt prefix for caching.
+    
+    Args:
+        prompt: Prompt text (a CacheablePrompt enables caching)
+        
+    Returns:
+        The prompt itself, or text blocks with cache_control on the shared prefix
+    """
+    if not isinstance(prompt, CacheablePrompt) or prompt.prefix_length <= 0:
+        return prompt
+    
+    blocks = [{"type": "text", "text": prompt[:prompt.prefix_length], "cache_control": {"type": "ephemeral"}}]
+    if len(prompt) > prompt.prefix_length:
+        blocks.append({"type": "text", "text": prompt[prompt.prefix_length:]})
+    return blocks
+
+
+class RateLimitBucket:
+    """
+    Client-side view of the Anthropic rate limits, fed by response headers.
+    
+    Every response reports how many requests and input tokens remain in the
+    current window and when it resets. acquire() counts requests against that
+    budget locally and, once it is spent, waits for the reset instead of
+    sending a request that would come back 429.
+    """
+    
+    def __init__(self):
+        """Initialize with an unknown budget (requests are not held back until headers arrive)."""
+        self.requests_remaining: Optional[int] = None
+        self.requests_reset: float = 0.0
+        self.tokens_remaining: Optional[int] = None
+        self.tokens_reset: float = 0.0
+    
+    async def acquire(self, estimated_tokens: int):
+        """
+        Wait until the budget allows a request, then reserve it.
+        
+        Args:
+            estimated_tokens: Estimated input tokens of the request
+        """
+        while True:
+            now = time.time()
+            if self.requests_remaining is not None and self.requests_remaining <= 0 and self.requests_reset > now:
+                wait = self.requests_reset - now
+            elif (self.tokens_remaining is not None and self.tokens_remaining < estimated_tokens
+                  and self.tokens_reset > now):
+                wait = self.tokens_reset - now
+            else:
+                break
+            logger.info("Anthropic rate limit budget spent, waiting %.1fs for reset", wait)
+            await asyncio.sleep(min(wait, MAX_RETRY_DELAY))
+        
+        if self.requests_remaining is not None:
+            self.requests_remaining -= 1
+        if self.tokens_remaining is not None:
+            self.tokens_remaining -= estimated_tokens
+    
+    def update_from_headers(self, headers: Mapping[str, str]):
+        """
+        Refresh the budget from the rate limit headers of an API response.
+        
+        Args:
+            headers: Response headers
+        """
+        requests = _parse_limit(headers, "requests")
+        if requests is not None:
+            self.requests_remaining, self.requests_reset = requests
+        tokens = _parse_limit(headers, "input-tokens") or _parse_limit(headers, "tokens")
+        if tokens is not None:
+            self.tokens_remaining, self.tokens_reset = tokens
+
+
+def _parse_limit(headers: Mapping[str, str], name: str) -> Optional[Tuple[int, float]]:
+    """Read the remaining count and reset time (epoch seconds) of one rate limit, if reported."""
+    remaining = headers.get(f"anthropic-ratelimit-{name}-remaining")
+    reset = headers.get(f"anthropic-ratelimit-{name}-reset")
+    if remaining is None or reset is None:
+        return None
+    try:
+        return int(remaining), datetime.fromisoformat(reset).timestamp()
+    except ValueError:
+        return None
+
+
+_client: Optional[httpx.AsyncClient] = None
+_logged_http_version = False
+_rate_limits = RateLimitBucket()
+_keepalive_task: Optional["asyncio.Task[None]"] = None
+
+# Caps concurrent Anthropic requests per event loop
+_semaphore: Optional[asyncio.Semaphore] = None
+_semaphore_loop: Optional[asyncio.AbstractEventLoop] = None
+
+# In-flight requests keyed by payload hash, so concurrent identical requests share one call
+_inflight: Dict[bytes, "asyncio.Task[str]"] = {}
+
+# Recently completed responses keyed by payload hash, as (expiry, text), oldest first
+RESPONSE_CACHE_SIZE = 1024
+RESPONSE_CACHE_TTL = 300.0
+# Only requests below this temperature are cached; composer calls at 0.3 ask for fresh replies
+MAX_CACHEABLE_TEMPERATURE = 0.3
+_response_cache: "OrderedDict[bytes, Tuple[float, str]]" = OrderedDict()
+
+
+async def _set_api_key(request: httpx.Request):
+    """Authenticate each request with the current key, so a reloaded config takes effect without a new client."""
+    request.headers["x-api-key"] = get_config().anthropic_api_key
+
+
+async def _log_http_version(response: httpx.Response):
+    """Log the protocol negotiated with Anthropic, once per process."""
+    global _logged_http_version
+    if not _logged_http_version:
+        _logged_http_version = True
+        logger.info("🔌 Anthropic API connection negotiated %s", response.http_version)
+
+
+def get_anthropic_client() -> httpx.AsyncClient:
+    """
+    Get the shared Anthropic HTTP client, creating it on first use.
+    
+    Every Claude call goes through this client so requests reuse warm
+    keep-alive (and, with h2 installed, multiplexed HTTP/2) connections
+    instead of paying a TCP and TLS handshake each time.
+    
+    Returns:
+        Pooled httpx.AsyncClient with Anthropic base URL and auth headers
+    """
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            base_url=ANTHROPIC_API_URL,
+            headers={
+                "Content-Type": "application/json",
+                "anthropic-version": ANTHROPIC_VERSION
+            },
+            http2=HTTP2_AVAILABLE,
+            # Fail fast on unreachable hosts; generation itself may take longer
+            timeout=httpx.Timeout(30.0, connect=5.0),
+            # With HTTP/2 concurrent requests multiplex over few connections; the
+            # higher ceiling covers HTTP/1.1 fallback under bursty webhook load
+            limits=httpx.Limits(max_keepalive_connections=50, max_connections=200,
+                                keepalive_expiry=KEEPALIVE_EXPIRY),
+            event_hooks={"request": [_set_api_key], "response": [_log_http_version]}
+        )
+        if not HTTP2_AVAILABLE:
+            logger.warning("h2 is not installed; Anthropic requests use HTTP/1.1 (pip install 'httpx[http2]')")
+    return _client
+
+
+async def warm_anthropic_connection(connections: Optional[int] = None, timeout: float = 5.0) -> bool:
+    """
+    Open pooled connections to the Anthropic API ahead of the first request.
+    
+    Sends concurrent HEAD requests so DNS, TCP and TLS setup (and HTTP/2
+    negotiation) happen now; the response status does not matter.
+    
+    Args:
+        connections: Connections to open (default: one with HTTP/2, a few with HTTP/1.1)
+        timeout: Seconds to wait before giving up
+        
+    Returns:
+        True if at least one connection was established
+    """
+    if connections is None:
+        connections = 1 if HTTP2_AVAILABLE else WARM_HTTP1_CONNECTIONS
+    
+    client = get_anthropic_client()
+    results = await asyncio.gather(
+        *(client.head("/v1/messages", timeout=timeout) for _ in range(connections)),
+        return_exceptions=True
+    )
+    errors = [result for result in results if isinstance(result, Exception)]
+    if errors:
+        logger.warning("Could not warm %d of %d Anthropic API connections: %s",
+                       len(errors), connections, errors[0])
+    return len(errors) < connections
+
+
+async def _keep_connection_warm(interval: float):
+    """
+    Periodically touch the Anthropic API so idle pooled connections are not closed.
+    
+    Failures are logged and never end the loop; only cancellation stops it.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await get_anthropic_client().head("/v1/messages", timeout=5.0)
+        except httpx.HTTPError as e:
+            logger.debug("Anthropic keep-alive request failed: %s", e)
+        except Exception:
+            logger.exception("Unexpected error in Anthropic keep-alive request")
+
+
+def start_connection_keepalive():
+    """
+    Start the background task that keeps Anthropic connections open between quiet periods.
+    
+    Does nothing when ANTHROPIC_KEEPALIVE_INTERVAL is 0 or the task is already running.
+    """
+    global _keepalive_task
+    interval = get_config().anthropic_keepalive_interval
+    if interval <= 0 or (_keepalive_task is not None and not _keepalive_task.done()):
+        return
+    if interval >= KEEPALIVE_EXPIRY:
+        logger.warning("ANTHROPIC_KEEPALIVE_INTERVAL of %ss exceeds the %ss pool idle timeout",
+                       interval, KEEPALIVE_EXPIRY)
+    _keepalive_task = asyncio.get_running_loop().create_task(_keep_connection_warm(interval))
+
+
+async def close_anthropic_client():
+    """Stop the keep-alive task, close the shared Anthropic HTTP client and release pooled connections."""
+    global _client, _keepalive_task
+    if _keepalive_task is not None:
+        _keepalive_task.cancel()
+        _keepalive_task = None
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+async def create_message(payload: Dict[str, Any]) -> str:
+    """
+    Send a Messages API request and return its text (all text blocks joined).
+    
+    Identical requests made while one is already in flight (e.g. a mailing list
+    blast hitting several webhooks at once) wait for that call instead of
+    issuing their own. Responses to requests below MAX_CACHEABLE_TEMPERATURE are also kept
+    for RESPONSE_CACHE_TTL seconds, so repeats shortly after are answered
+    without a network hop.
+    
+    Args:
+        payload: Messages API request body (model, max_tokens, messages, ...)
+        
+    Returns:
+        Response text
+        
+    Raises:
+        httpx.HTTPStatusError: If the API returns an error status
+    """
+    # Sorted keys make the serialized body double as a stable deduplication key
+    body = orjson.dumps(payload, option=orjson.OPT_SORT_KEYS)
+    key = hashlib.blake2b(body, digest_size=16).digest()
+    cacheable = payload.get("temperature", 1.0) < MAX_CACHEABLE_TEMPERATURE
+    if cacheable:
+        cached = _response_cache.get(key)
+        if cached is not None:
+            if cached[0] > time.monotonic():
+                _response_cache.move_to_end(key)
+                return cached[1]
+            del _response_cache[key]
+    
+    task = _inflight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(_post_message(body))
+        _inflight[key] = task
+        
+        def forget(done: "asyncio.Task[str]"):
+            if _inflight.get(key) is done:
+                del _inflight[key]
+            if cacheable and not done.cancelled() and done.exception() is None:
+                _response_cache[key] = (time.monotonic() + RESPONSE_CACHE_TTL, done.result())
+                _response_cache.move_to_end(key)
+                while len(_response_cache) > RESPONSE_CACHE_SIZE:
+                    _response_cache.popitem(last=False)
+        
+        task.add_done_callback(forget)
+    
+    # Shielded so one caller being cancelled does not cancel the shared request
+    return await asyncio.shield(task)
+
+
+async def _post_message(body: bytes) -> str:
+    """Post a serialized Messages API request and return its joined text blocks."""
+    response = await post_with_retry("/v1/messages", body)
+    return message_text(orjson.loads(response.content))
+
+
+def message_text(message: Dict[str, Any]) -> str:
+    """
+    Extract the text of a Messages API response.
+    
+    Joins every text block rather than assuming the first block is text, so
+    responses that lead with other block types still parse.
+    
+    Args:
+        message: Decoded Messages API response
+        
+    Returns:
+        Concatenated text content
+        
+    Raises:
+        ValueError: If the response has no text content
+    """
+    texts = [block["text"] for block in message.get("content", ()) if block.get("type", "text") == "text"]
+    if not texts:
+        raise ValueError(f"Anthropic response has no text content (stop_reason: {message.get('stop_reason')})")
+    if message.get("stop_reason") == "max_tokens":
+        logger.warning("Anthropic response was truncated at max_tokens")
+    return "".join(texts)
+
+
+def _get_semaphore() -> Optional[asyncio.Semaphore]:
+    """Get the request concurrency limit for the running loop (None when unbounded)."""
+    global _semaphore, _semaphore_loop
+    loop = asyncio.get_running_loop()
+    if loop is not _semaphore_loop:
+        limit = get_config().anthropic_max_concurrency
+        _semaphore = asyncio.Semaphore(limit) if limit > 0 else None
+        _semaphore_loop = loop
+    return _semaphore
+
+
+def _retry_delay(attempt: int, response: Optional[httpx.Response]) -> float:
+    """Seconds to wait before a retry, honoring the retry-after header when present."""
+    if response is not None:
+        try:
+            return min(float(response.headers["retry-after"]), MAX_RETRY_DELAY)
+        except (KeyError, ValueError):
+            pass
+    # Exponential backoff with full jitter: 0-1s, 0-2s, 0-4s, ...
+    return random.uniform(0, min(2 ** attempt, MAX_RETRY_DELAY))
+
+
+async def post_with_retry(url: str, body: bytes) -> httpx.Response:
+    """
+    POST a JSON body to the Anthropic API within the concurrency and rate limits, retrying transient failures.
+    
+    Args:
+        url: API path or absolute URL
+        body: Serialized JSON request body
+        
+    Returns:
+        Successful response
+        
+    Raises:
+        httpx.HTTPStatusError: If the API returns a non-retryable error or retries run out
+        httpx.TransportError: If the connection fails (failures before the request is sent are retried first)
+    """
+    semaphore = _get_semaphore()
+    # About four bytes of JSON per input token
+    estimated_tokens = len(body) // 4
+    attempt = 0
+    while True:
+        response = None
+        try:
+            await _rate_limits.acquire(estimated_tokens)
+            if semaphore is None:
+                response = await get_anthropic_client().post(url, content=body)
+            else:
+                async with semaphore:
+                    response = await get_anthropic_client().post(url, content=body)
+            _rate_limits.update_from_headers(response.headers)
+            if response.status_code not in RETRYABLE_STATUS_CODES or attempt >= MAX_RETRIES:
+                response.raise_for_status()
+                return response
+        except RETRYABLE_TRANSPORT_ERRORS:
+            if attempt >= MAX_RETRIES:
+                raise
+        
+        # Wait outside the semaphore so other requests can proceed
+        delay = _retry_delay(attempt, response)
+        attempt += 1
+        logger.warning("Anthropic request failed (%s), retry %d/%d in %.1fs",
+                       response.status_code if response is not None else "connection error",
+                       attempt, MAX_RETRIES, delay)
+        await asyncio.sleep(delay)
+
+
+async def stream_message(payload: Dict[str, Any]) -> AsyncIterator[str]:
+    """
+    Stream a Messages API response as text deltas.
+    
+    For consumers that can act on partial output (e.g. relaying a draft to a
+    dashboard as it is written); callers that need the whole text should use
+    create_message, which avoids the event-stream overhead.
+    
+    Streams share the concurrency and rate limits of post_with_retry, holding
+    a concurrency slot until the stream ends. Retryable statuses and
+    connection failures are retried only before the first text delta, so a
+    caller never sees output repeated.
+    
+    Args:
+        payload: Messages API request body (``stream`` is set automatically)
+        
+    Yields:
+        Text fragments in the order the model produces them
+        
+    Raises:
+        httpx.HTTPStatusError: If the API returns a non-retryable error or retries run out
+        httpx.TransportError: If the connection fails mid-stream or retries run out
+        RuntimeError: If the stream reports an error event
+    """
+    body = orjson.dumps({**payload, "stream": True})
+    semaphore = _get_semaphore()
+    estimated_tokens = len(body) // 4
+    streamed = False
+    attempt = 0
+    while True:
+        response = None
+        await _rate_limits.acquire(estimated_tokens)
+        if semaphore is not None:
+            await semaphore.acquire()
+        try:
+            async with get_anthropic_client().stream("POST", "/v1/messages", content=body) as response:
+                _rate_limits.update_from_headers(response.headers)
+                if response.status_code not in RETRYABLE_STATUS_CODES or attempt >= MAX_RETRIES:
+                    response.raise_for_status()
+                    async for text in _text_deltas(response):
+                        streamed = True
+                        yield text
+                    return
+        except RETRYABLE_TRANSPORT_ERRORS:
+            if streamed or attempt >= MAX_RETRIES:
+                raise
+        finally:
+            if semaphore is not None:
+                semaphore.release()
+        
+        # Wait outside the semaphore so other requests can proceed
+        delay = _retry_delay(attempt, response)
+        attempt += 1
+        logger.warning("Anthropic stream failed to start (%s), retry %d/%d in %.1fs",
+                       response.status_code if response is not None else "connection error",
+                       attempt, MAX_RETRIES, delay)
+        await asyncio.sleep(delay)
+
+
+async def _text_deltas(response: httpx.Response) -> AsyncIterator[str]:
+    """Decode the text deltas of a streamed Messages API response."""
+    async for line in response.aiter_lines():
+        if not line.startswith("data:"):
+            continue
+        
+        event = orjson.loads(line[5:])
+        event_type = event.get("type")
+        if event_type == "content_block_delta" and event["delta"].get("type") == "text_delta":
+            yield event["delta"]["text"]
+        elif event_type == "error":
+            raise RuntimeError(f"Anthropic stream error: {event.get('error')}")
+        elif event_type == "message_stop":
+            return
@@ -0,0 +1,205 @@
+"""
+Micro-batching for AI email classification.
+📦 Coalesces classification prompts that arrive close together into one Claude call.
+"""
+
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+import orjson
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on output tokens for a single batched request
+MAX_BATCH_OUTPUT_TOKENS = 8192
+
+# Pending prompts are grouped by (client_id, service_tier)
+BatchKey = Tuple[Optional[str], Optional[str]]
+
+_BATCH_PROMPT_HEADER = """You will receive {count} independent email classification requests, each starting with a line "=== REQUEST <n> ===".
+Handle every request on its own, following only the instructions inside that request.
+
+Respond with ONLY a JSON array containing exactly {count} objects. Element n of the array must be the JSON classification requested by REQUEST n, in the same order. Do not include any other text.
+"""
+
+
+class ClassificationBatcher:
+    """
+    Collects classification prompts for a short window and sends them together.
+    
+    Batching is opt-in (window_ms > 0) and only ever combines prompts from the
+    same client and service tier, so one tenant's email text never shares a
+    request with another's. A prompt that arrives alone is sent unchanged, so
+    low-traffic behavior is identical to unbatched classification. If a batched call fails or returns
+    an unusable response, each prompt in the batch is retried individually.
+    """
+    
+    def __init__(self, classify_one: Callable[[str, Optional[str]], Awaitable[Dict[str, Any]]],
+                 complete: Callable[[str, int, Optional[str]], Awaitable[str]],
+                 validate: Callable[[Dict[str, Any]], Dict[str, Any]],
+                 window_ms: int = 0, max_batch_size: int = 16,
+                 tokens_per_item: int = 500, max_concurrency: int = 0):
+        """
+        Initialize classification batcher.
+        
+        Args:
+            classify_one: Classifies a single prompt for a service tier and returns the parsed result
+            complete: Sends a prompt with a max_tokens budget and service tier, returning the raw text
+            validate: Validates one parsed classification, raising ValueError if unusable
+            window_ms: How long to wait for more prompts before sending (0 disables batching)
+            max_batch_size: Maximum number of prompts per request
+            tokens_per_item: Output token budget per prompt in a batch
+            max_concurrency: Maximum AI calls in flight at once (0 for unbounded)
+        """
+        self._classify_one = classify_one
+        self._complete = complete
+        self._validate = validate
+        self.window_seconds = window_ms / 1000
+        self.max_batch_size = max_batch_size
+        self.tokens_per_item = tokens_per_item
+        self.max_concurrency = max_concurrency
+        
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._pending: Dict[BatchKey, List[Tuple[str, asyncio.Future]]] = {}
+        self._flush_handles: Dict[BatchKey, asyncio.TimerHandle] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        self._semaphore: Optional[asyncio.Semaphore] = None
+    
+    @property
+    def enabled(self) -> bool:
+        """Whether prompts are coalesced at all."""
+        return self.window_seconds > 0 and self.max_batch_size > 1
+    
+    async def classify(self, prompt: str, service_tier: Optional[str] = None,
+                       client_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Classify a prompt, possibly together with other concurrent prompts.
+        
+        Only prompts for the same client and service tier are batched together.
+        
+        Args:
+            prompt: Composed classification prompt
+            service_tier: Anthropic service tier for the request (None for API default)
+            client_id: Client the email belongs to (None for unidentified emails)
+        
+        Returns:
+            Parsed classification result for this prompt
+        """
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            # Pending futures and the semaphore belong to a single event loop
+            self._loop = loop
+            self._pending = {}
+            self._flush_handles = {}
+            self._semaphore = asyncio.Semaphore(self.max_concurrency) if self.max_concurrency > 0 else None
+        
+        if not self.enabled:
+            return await self._limited(self._classify_one(prompt, service_tier))
+        
+        key = (client_id, service_tier)
+        future = loop.create_future()
+        pending = self._pending.setdefault(key, [])
+        pending.append((prompt, future))
+        
+        if len(pending) >= self.max_batch_size:
+            self._flush(key)
+        elif key not in self._flush_handles:
+            self._flush_handles[key] = loop.call_later(self.window_seconds, self._flush, key)
+        
+        return await future
+    
+    def _flush(self, key: BatchKey):
+        """Send all pending prompts for a client and service tier as one batch."""
+        handle = self._flush_handles.pop(key, None)
+        if handle is not None:
+            handle.cancel()
+        
+        batch = self._pending.pop(key, [])
+        if not batch:
+            return
+        
+        task = self._loop.create_task(self._run_batch(batch, key[1]))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+    
+    async def _limited(self, coro: Awaitable[Any]) -> Any:
+        """Await a coroutine within the concurrency limit."""
+        if self._semaphore is None:
+            return await coro
+        async with self._semaphore:
+            return await coro
+    
+    async def _run_batch(self, batch: List[Tuple[str, asyncio.Future]], service_tier: Optional[str]):
+        """
+        Classify a batch and resolve each caller's future.
+        
+        Args:
+            batch: List of (prompt, future) pairs
+            service_tier: Anthropic service tier shared by the batch
+        """
+        if len(batch) == 1:
+            prompt, future = batch[0]
+            await self._resolve(future, self._limited(self._classify_one(prompt, service_tier)))
+            return
+        
+        try:
+            results = await self._limited(
+                self._classify_many([prompt for prompt, _ in batch], service_tier)
+            )
+        except Exception as e:
+            logger.warning("Batched classification of %d emails failed, retrying individually: %s",
+                           len(batch), e)
+            await asyncio.gather(*(
+                self._resolve(future, self._limited(self._classify_one(prompt, service_tier)))
+                for prompt, future in batch
+            ))
+            return
+        
+        logger.info("📦 Classified %d emails in one batched AI call", len(batch))
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+    
+    async def _classify_many(self, prompts: List[str], service_tier: Optional[str]) -> List[Dict[str, Any]]:
+        """
+        Classify several prompts with a single AI call.
+        
+        Args:
+            prompts: Composed classification prompts
+            service_tier: Anthropic service tier for the request
+        
+        Returns:
+            Parsed classifications in the same order as the prompts
+        
+        Raises:
+            ValueError: If the AI response is not a usable JSON array
+        """
+        sections = [_BATCH_PROMPT_HEADER.format(count=len(prompts))]
+        for index, prompt in enumerate(prompts, 1):
+            sections.append(f"=== REQUEST {index} ===\n{prompt.strip()}\n")
+        
+        max_tokens = min(self.tokens_per_item * len(prompts), MAX_BATCH_OUTPUT_TOKENS)
+        ai_response = await self._complete("\n".join(sections), max_tokens, service_tier)
+        
+        try:
+            results = orjson.loads(ai_response)
+        except orjson.JSONDecodeError as e:
+            raise ValueError(f"Invalid batched AI response format: {e}")
+        
+        if not isinstance(results, list) or len(results) != len(prompts):
+            raise ValueError(f"Expected a JSON array of {len(prompts)} classifications")
+        
+        return [self._validate(result) for result in results]
+    
+    @staticmethod
+    async def _resolve(future: asyncio.Future, coro: Awaitable[Dict[str, Any]]):
+        """Await a coroutine and transfer its outcome to a future."""
+        try:
+            result = await coro
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+        else:
+            if not future.done():
+                future.set_result(result)
@@ -3,15 +3,96 @@ AI email classification using Anthropic Claude 3.5 Sonnet.
 🤖 Core intelligence for email routing decisions.
 """
 
+import asyncio
+import hashlib
 import logging
-import httpx
-import json
-from typing import Dict, Any
-from datetime import datetime
+import orjson
+from collections import OrderedDict
+from typing import Dict, Any, Optional
 from ..utils.config import get_config
+from ..utils.email_text import trim_body
+from ..utils.timestamps import utc_timestamp
+from .anthropic_client import create_message
+from .semantic_cache import SemanticCache, SEMANTIC_CACHE_AVAILABLE
 
 logger = logging.getLogger(__name__)
 
+# Static parts of the classification prompt; only the email fields vary per call
+_PROMPT_PREFIX = """
+You are an intelligent email classifier for a business. Analyze this email and classify it:
+
+Categories:
+- billing: Payment issues, invoices, account billing
+- support: Technical problems, how-to questions, product issues  
+- sales: Pricing inquiries, product demos, new business
+- general: Everything else
+
+Email:
+"""
+
+_PROMPT_SUFFIX = """
+
+Respond in JSON format:
+{
+    "category": "one of the categories above",
+    "confidence": 0.95,
+    "reasoning": "Brief explanation",
+    "suggested_actions": ["action1", "action2"]
+}
+"""
+
+# Fallback keyword rules in priority order: (keywords, category, confidence, actions)
+_FALLBACK_RULES = (
+    (("billing", "invoice"), "billing", 0.85, ("check_payment", "billing_support")),
+    (("support", "help"), "support", 0.90, ("technical_assistance", "troubleshooting")),
+    (("sales", "pricing"), "sales", 0.80, ("schedule_demo", "send_pricing")),
+)
+
+# Exact-match cache of AI classifications keyed by an email fingerprint (LRU order)
+_classification_cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+
+def _fingerprint(subject: str, body: str) -> str:
+    """Hash subject and leading body into a compact cache key."""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(subject.encode("utf-8", "surrogatepass"))
+    digest.update(b"\x00")
+    digest.update(body[:4096].encode("utf-8", "surrogatepass"))
+    return digest.hexdigest()
+
+
+def _get_cached_classification(fingerprint: str) -> Optional[Dict[str, Any]]:
+    """Get a cached classification with a fresh timestamp, if present."""
+    cached = _classification_cache.get(fingerprint)
+    if cached is None:
+        return None
+    _classification_cache.move_to_end(fingerprint)
+    return {**cached, "timestamp": utc_timestamp()}
+
+
+def _cache_classification(fingerprint: str, classification: Dict[str, Any], max_size: int):
+    """Store a classification, evicting the least recently used entries."""
+    _classification_cache[fingerprint] = {k: v for k, v in classification.items() if k != "timestamp"}
+    _classification_cache.move_to_end(fingerprint)
+    while len(_classification_cache) > max_size:
+        _classification_cache.popitem(last=False)
+
+
+# Near-duplicate tier behind the exact cache, created on first use when enabled
+_semantic_cache: Optional[SemanticCache] = None
+
+
+def _get_semantic_cache() -> Optional[SemanticCache]:
+    """Get the semantic cache, or None when disabled or unavailable."""
+    global _semantic_cache
+    config = get_config()
+    if not config.classifier_semantic_cache or not SEMANTIC_CACHE_AVAILABLE:
+        return None
+    if _semantic_cache is None:
+        _semantic_cache = SemanticCache(threshold=config.classifier_semantic_threshold)
+    return _semantic_cache
+
+
 async def classify_email(subject: str, body: str, sender: str = None) -> Dict[str, Any]:
     """
     🤖 Classify email using Claude 3.5 Sonnet
@@ -32,60 +113,59 @@ async def classify_email(subject: str, body: str, sender: str = None) -> Dict[st
     
     config = get_config()
     
-    prompt = f"""
-You are an intelligent email classifier for a business. Analyze this email and classify it:
-
-Categories:
-- billing: Payment issues, invoices, account billing
-- support: Technical problems, how-to questions, product issues  
-- sales: Pricing inquiries, product demos, new business
-- general: Everything else
-
-Email:
-Subject: {subject}
-Body: {body}
-{f"From: {sender}" if sender else ""}
-
-Respond in JSON format:
-{{
-    "category": "one of the categories above",
-    "confidence": 0.95,
-    "reasoning": "Brief explanation",
-    "suggested_actions": ["action1", "action2"]
-}}
-"""
+    # Repeated emails (auto-responders, mailing lists, bounce loops) skip the AI call
+    fingerprint = None
+    if config.classifier_cache_size > 0:
+        fingerprint = _fingerprint(subject, body)
+        cached = _get_cached_classification(fingerprint)
+        if cached is not None:
+            logger.debug(f"Classification cache hit: {cached['category']}")
+            return cached
+    
+    # Near-duplicates (newsletters, templated outreach, bot tickets) match by embedding
+    semantic_cache = _get_semantic_cache()
+    vector = None
+    if semantic_cache is not None:
+        try:
+            vector = await asyncio.to_thread(semantic_cache.embed, f"{subject}\n{body[:2048]}")
+            similar = semantic_cache.lookup(vector)
+            if similar is not None:
+                if fingerprint is not None:
+                    _cache_classification(fingerprint, similar, config.classifier_cache_size)
+                return {**similar, "timestamp": utc_timestamp()}
+        except Exception as e:
+            logger.warning(f"Semantic cache lookup failed: {e}")
+            vector = None
+    
+    prompt = "".join((
+        _PROMPT_PREFIX,
+        "Subject: ", subject, "\nBody: ", trim_body(body), "\n",
+        "From: " + sender if sender else "",
+        _PROMPT_SUFFIX
+    ))
 
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                "https://api.anthropic.com/v1/messages",
-                headers={
-                    "Content-Type": "application/json",
-                    "x-api-key": config.anthropic_api_key,
-                    "anthropic-version": "2023-06-01"
-                },
-                json={
-                    "model": config.anthropic_model,
-                    "max_tokens": 500,
-                    "temperature": 0.1,
-                    "messages": [{"role": "user", "content": prompt}]
-                },
-                timeout=30.0
-            )
-            
-            response.raise_for_status()
-            result = response.json()
-            
-            # Parse AI response
-            ai_response = result["content"][0]["text"]
-            classification = json.loads(ai_response)
-            
-            # Add metadata
-            classification["ai_model"] = config.anthropic_model
-            classification["timestamp"] = datetime.utcnow().isoformat()
-            
-            logger.info(f"🎯 AI Classification: {classification['category']} ({classification['confidence']:.2f})")
-            return classification
+        ai_response = await create_message({
+            "model": config.anthropic_model,
+            "max_tokens": 200,  # The JSON classification is well under this
+            "temperature": 0.1,
+            "messages": [{"role": "user", "content": prompt}]
+        })
+        
+        # Parse AI response
+        classification = orjson.loads(ai_response)
+        
+        # Add metadata
+        classification["ai_model"] = config.anthropic_model
+        classification["timestamp"] = utc_timestamp()
+        
+        if fingerprint is not None:
+            _cache_classification(fingerprint, classification, config.classifier_cache_size)
+        if vector is not None:
+            semantic_cache.add(vector, {k: v for k, v in classification.items() if k != "timestamp"})
+        
+        logger.info(f"🎯 AI Classification: {classification['category']} ({classification['confidence']:.2f})")
+        return classification
             
     except Exception as e:
         logger.warning(f"🔄 AI classification failed, using fallback: {e}")
@@ -97,24 +177,17 @@ def _classify_fallback(subject: str) -> Dict[str, Any]:
     """Simple keyword-based fallback classification."""
     subject_lower = subject.lower()
     
-    if "billing" in subject_lower or "invoice" in subject_lower:
-        category, confidence = "billing", 0.85
-        actions = ["check_payment", "billing_support"]
-    elif "support" in subject_lower or "help" in subject_lower:
-        category, confidence = "support", 0.90
-        actions = ["technical_assistance", "troubleshooting"]
-    elif "sales" in subject_lower or "pricing" in subject_lower:
-        category, confidence = "sales", 0.80
-        actions = ["schedule_demo", "send_pricing"]
+    for keywords, category, confidence, actions in _FALLBACK_RULES:
+        if any(word in subject_lower for word in keywords):
+            break
     else:
-        category, confidence = "general", 0.60
-        actions = ["manual_review", "general_inquiry"]
+        category, confidence, actions = "general", 0.60, ("manual_review", "general_inquiry")
     
     return {
         "category": category,
         "confidence": confidence,
         "reasoning": f"Keyword-based fallback classification",
-        "suggested_actions": actions,
+        "suggested_actions": list(actions),
         "ai_model": "fallback",
-        "timestamp": datetime.utcnow().isoformat()
+        "timestamp": utc_timestamp()
     } 
\ No newline at end of file
@@ -3,7 +3,11 @@ Enhanced client manager service for advanced multi-tenant operations.
 🏢 Provides intelligent client identification with multiple domain support and fuzzy matching.
 """
 
+import heapq
 import logging
+import sys
+import threading
+from collections import OrderedDict
 from typing import Dict, List, Optional, Set, Tuple
 from functools import lru_cache
 from fastapi import Depends
@@ -18,7 +22,6 @@ from ..models.client_config import ClientConfig, RoutingRules
 from ..utils.domain_resolver import (
     extract_domain_from_email,
     normalize_domain,
-    get_domain_hierarchy,
     get_domain_variants,
     DomainMatcher,
     calculate_domain_similarity
@@ -26,6 +29,12 @@ from ..utils.domain_resolver import (
 
 logger = logging.getLogger(__name__)
 
+# Categories every client is expected to route
+REQUIRED_ROUTING_CATEGORIES = frozenset(('support', 'billing', 'sales', 'general'))
+
+# Domains whose identification result is remembered (tenant domains recur constantly)
+IDENTIFICATION_CACHE_SIZE = 4096
+
 
 class ClientIdentificationResult:
     """Result of client identification with confidence scoring."""
@@ -54,21 +63,32 @@ class EnhancedClientManager:
     def __init__(self):
         """Initialize the enhanced client manager."""
         self._clients_cache: Dict[str, ClientConfig] = {}
+        self._routing_cache: Dict[str, RoutingRules] = {}
         self._domain_to_client_cache: Dict[str, str] = {}
         self._client_to_domains_cache: Dict[str, Set[str]] = {}
+        self._flat_domain_list: Tuple[Tuple[str, str], ...] = ()
+        self._identification_cache: "OrderedDict[str, ClientIdentificationResult]" = OrderedDict()
         self._domain_matcher = DomainMatcher()
         self._initialized = False
+        self._init_lock = threading.Lock()
         
         # Configuration for identification strategies
         self.confidence_threshold = 0.7
         self.enable_fuzzy_matching = True
         self.enable_hierarchy_matching = True
     
+    def initialize(self):
+        """Build the domain mapping now rather than on the first identification (idempotent)."""
+        self._ensure_initialized()
+    
     def _ensure_initialized(self):
-        """Ensure client manager is initialized."""
-        if not self._initialized:
-            self._build_comprehensive_domain_mapping()
-            self._initialized = True
+        """Ensure client manager is initialized (once, even under concurrent first use)."""
+        if self._initialized:
+            return
+        with self._init_lock:
+            if not self._initialized:
+                self._build_comprehensive_domain_mapping()
+                self._initialized = True
     
     def _build_comprehensive_domain_mapping(self):
         """
@@ -80,57 +100,38 @@ class EnhancedClientManager:
         logger.info("Building comprehensive domain to client mapping...")
         self._domain_to_client_cache.clear()
         self._client_to_domains_cache.clear()
+        self._clients_cache.clear()
+        self._routing_cache.clear()
+        self._identification_cache.clear()
         
         available_clients = get_available_clients()
         
         for client_id in available_clients:
             try:
+                client_id = sys.intern(client_id)
                 client_config = load_client_config(client_id)
-                client_domains = set()
+                self._clients_cache[client_id] = client_config
+                client_domains = self._collect_domains(client_config)
                 
-                # Primary domain
-                primary_domain = normalize_domain(client_config.domains.primary)
-                if primary_domain:
-                    self._domain_to_client_cache[primary_domain] = client_id
-                    client_domains.add(primary_domain)
-                    
-                    # Add domain variants for primary domain
-                    for variant in get_domain_variants(primary_domain):
-                        self._domain_to_client_cache[variant] = client_id
-                        client_domains.add(variant)
-                
-                # Support email domain
-                support_email = client_config.domains.support
-                support_domain = extract_domain_from_email(support_email)
-                if support_domain and support_domain != primary_domain:
-                    support_domain = normalize_domain(support_domain)
-                    if support_domain:
-                        self._domain_to_client_cache[support_domain] = client_id
-                        client_domains.add(support_domain)
-                        
-                        # Add variants for support domain
-                        for variant in get_domain_variants(support_domain):
-                            self._domain_to_client_cache[variant] = client_id
-                            client_domains.add(variant)
-                
-                # Mailgun domain
-                mailgun_domain = normalize_domain(client_config.domains.mailgun)
-                if mailgun_domain and mailgun_domain not in [primary_domain, support_domain]:
-                    self._domain_to_client_cache[mailgun_domain] = client_id
-                    client_domains.add(mailgun_domain)
-                    
-                    # Add variants for mailgun domain
-                    for variant in get_domain_variants(mailgun_domain):
-                        self._domain_to_client_cache[variant] = client_id
-                        client_domains.add(variant)
+                self._domain_to_client_cache.update(dict.fromkeys(client_domains, client_id))
                 
                 # Store client domains for reverse lookup
                 self._client_to_domains_cache[client_id] = client_domains
                 
-                logger.debug(f"Mapped {len(client_domains)} domains for {client_id}: {list(client_domains)[:5]}...")
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug(f"Mapped {len(client_domains)} domains for {client_id}: {list(client_domains)[:5]}...")
                 
             except ClientLoadError as e:
                 logger.error(f"Failed to load client {client_id} during domain mapping: {e}")
+                continue
+            
+            try:
+                self._routing_cache[client_id] = load_routing_rules(client_id)
+            except ClientLoadError as e:
+                logger.warning(f"Failed to preload routing rules for {client_id}: {e}")
+        
+        # Flat (domain, client_id) pairs for the similarity fallback sweep
+        self._flat_domain_list = tuple(self._domain_to_client_cache.items())
         
         # Configure domain matcher with known domains
         all_domains = list(self._domain_to_client_cache.keys())
@@ -141,20 +142,49 @@ class EnhancedClientManager:
         logger.info(f"Comprehensive domain mapping complete: {len(self._domain_to_client_cache)} domains mapped "
                    f"for {len(available_clients)} clients")
     
+    @staticmethod
+    def _collect_domains(client_config: ClientConfig) -> Set[str]:
+        """
+        Collect every domain a client receives mail on.
+        
+        Covers the primary, support and mailgun domains plus their variants.
+        
+        Args:
+            client_config: Client configuration
+            
+        Returns:
+            Set of normalized, interned domains and variants
+        """
+        domains = set()
+        support_domain = extract_domain_from_email(client_config.domains.support)
+        
+        for raw_domain in (client_config.domains.primary, support_domain, client_config.domains.mailgun):
+            domain = normalize_domain(raw_domain) if raw_domain else None
+            if domain and domain not in domains:
+                domains.add(domain)
+                domains.update(get_domain_variants(domain))
+        
+        # Interned so the forward map, reverse sets and matcher share one copy of each domain
+        return {sys.intern(domain) for domain in domains}
+    
     def get_available_clients(self) -> List[str]:
         """
         Get list of available client IDs.
         
+        Does not build the domain mapping; client configs are loaded lazily
+        by the accessors that need them.
+        
         Returns:
             List of client IDs
         """
-        self._ensure_initialized()
         return get_available_clients()
     
     def get_client_config(self, client_id: str) -> ClientConfig:
         """
         Get client configuration by ID.
         
+        Served from the manager's cache; call refresh_client() to pick up edits.
+        
         Args:
             client_id: Client identifier
             
@@ -166,16 +196,43 @@ class EnhancedClientManager:
         """
         self._ensure_initialized()
         
+        client_config = self._clients_cache.get(client_id)
+        if client_config is not None:
+            return client_config
+        
         try:
-            return load_client_config(client_id)
+            client_config = load_client_config(client_id)
         except ClientLoadError as e:
             logger.error(f"Failed to get client config for {client_id}: {e}")
             raise
+        
+        self._clients_cache[client_id] = client_config
+        return client_config
+    
+    def get_client_config_optional(self, client_id: str) -> Optional[ClientConfig]:
+        """
+        Get client configuration by ID, or None if it cannot be loaded.
+        
+        For callers that fall back to generic behavior; the load error is
+        logged by get_client_config.
+        
+        Args:
+            client_id: Client identifier
+            
+        Returns:
+            ClientConfig object, or None if the client cannot be loaded
+        """
+        try:
+            return self.get_client_config(client_id)
+        except ClientLoadError:
+            return None
     
     def get_routing_rules(self, client_id: str) -> RoutingRules:
         """
         Get routing rules for a client.
         
+        Served from the manager's cache; call refresh_client() to pick up edits.
+        
         Args:
             client_id: Client identifier
             
@@ -187,11 +244,18 @@ class EnhancedClientManager:
         """
         self._ensure_initialized()
         
+        routing_rules = self._routing_cache.get(client_id)
+        if routing_rules is not None:
+            return routing_rules
+        
         try:
-            return load_routing_rules(client_id)
+            routing_rules = load_routing_rules(client_id)
         except ClientLoadError as e:
             logger.error(f"Failed to get routing rules for {client_id}: {e}")
             raise
+        
+        self._routing_cache[client_id] = routing_rules
+        return routing_rules
     
     def get_client_domains(self, client_id: str) -> Set[str]:
         """
@@ -210,6 +274,8 @@ class EnhancedClientManager:
         """
         Identify client by domain with advanced matching strategies.
         
+        Results are cached per normalized domain until the mapping is rebuilt.
+        
         Args:
             domain: Email domain (e.g., 'company.com')
             
@@ -222,6 +288,27 @@ class EnhancedClientManager:
         if not domain:
             return ClientIdentificationResult(method="invalid_domain")
         
+        result = self._identification_cache.get(domain)
+        if result is not None:
+            self._identification_cache.move_to_end(domain)
+            return result
+        
+        result = self._match_domain(domain)
+        self._identification_cache[domain] = result
+        if len(self._identification_cache) > IDENTIFICATION_CACHE_SIZE:
+            self._identification_cache.popitem(last=False)
+        return result
+    
+    def _match_domain(self, domain: str) -> ClientIdentificationResult:
+        """
+        Run the identification strategies for a normalized domain.
+        
+        Args:
+            domain: Normalized email domain
+            
+        Returns:
+            ClientIdentificationResult with confidence scoring
+        """
         logger.debug(f"Identifying client for domain: {domain}")
         
         # Strategy 1: Exact domain match
@@ -237,8 +324,11 @@ class EnhancedClientManager:
         
         # Strategy 2: Domain hierarchy matching
         if self.enable_hierarchy_matching:
-            hierarchy = get_domain_hierarchy(domain)
-            for i, level in enumerate(hierarchy[1:], 1):  # Skip first (exact) match
+            # Walk parent suffixes of the normalized domain in place (deepest first)
+            level, i = domain, 0
+            while level.count('.') > 1:
+                level = level[level.index('.') + 1:]
+                i += 1
                 client_id = self._domain_to_client_cache.get(level)
                 if client_id:
                     confidence = max(0.7, 1.0 - (i * 0.1))  # Decrease confidence by depth
@@ -251,6 +341,8 @@ class EnhancedClientManager:
                     )
         
         # Strategy 3: Fuzzy matching using domain matcher
+        similar_domain, similarity = None, 0.0
+        similarity_scored = False
         if self.enable_fuzzy_matching:
             candidate_domains = list(self._domain_to_client_cache.keys())
             best_match, confidence, method = self._domain_matcher.match_domain(domain, candidate_domains)
@@ -265,31 +357,30 @@ class EnhancedClientManager:
                     method=f"fuzzy_{method}",
                     domain_used=best_match
                 )
+            
+            if method in ("similarity_match", "no_match"):
+                # The matcher already scored every candidate; reuse its best for Strategy 4
+                similar_domain, similarity = best_match, confidence
+                similarity_scored = True
         
         # Strategy 4: Similarity-based fallback
-        all_client_domains = []
-        for client_domains in self._client_to_domains_cache.values():
-            all_client_domains.extend(client_domains)
-        
-        best_similarity = 0.0
-        best_similar_domain = None
-        
-        for candidate_domain in all_client_domains:
-            similarity = calculate_domain_similarity(domain, candidate_domain)
-            if similarity > best_similarity:
-                best_similarity = similarity
-                best_similar_domain = candidate_domain
-        
-        if best_similar_domain and best_similarity >= 0.6:
-            client_id = self._domain_to_client_cache.get(best_similar_domain)
+        if not similarity_scored:
+            for candidate_domain, _ in self._flat_domain_list:
+                candidate_similarity = calculate_domain_similarity(domain, candidate_domain)
+                if candidate_similarity > similarity:
+                    similarity = candidate_similarity
+                    similar_domain = candidate_domain
+        
+        if similar_domain and similarity >= 0.6:
+            client_id = self._domain_to_client_cache.get(similar_domain)
             if client_id:
-                logger.debug(f"Similarity match: {domain} -> {best_similar_domain} -> {client_id} "
-                           f"(similarity: {best_similarity:.2f})")
+                logger.debug(f"Similarity match: {domain} -> {similar_domain} -> {client_id} "
+                           f"(similarity: {similarity:.2f})")
                 return ClientIdentificationResult(
                     client_id=client_id,
-                    confidence=best_similarity,
+                    confidence=similarity,
                     method="similarity_match",
-                    domain_used=best_similar_domain
+                    domain_used=similar_domain
                 )
         
         logger.warning(f"No client found for domain: {domain}")
@@ -305,6 +396,19 @@ class EnhancedClientManager:
         Returns:
             ClientIdentificationResult with confidence scoring
         """
+        self._ensure_initialized()
+        
+        # Fast path: bare address whose domain is in the precomputed index
+        fast_domain = (email or '').rpartition('@')[2].strip().lower()
+        client_id = self._domain_to_client_cache.get(fast_domain)
+        if client_id:
+            return ClientIdentificationResult(
+                client_id=client_id,
+                confidence=1.0,
+                method="exact_match",
+                domain_used=fast_domain
+            )
+        
         domain = extract_domain_from_email(email)
         if not domain:
             logger.warning(f"Invalid email format: {email}")
@@ -391,15 +495,7 @@ class EnhancedClientManager:
             Response time string (e.g., 'within 4 hours')
         """
         try:
-            client_config = self.get_client_config(client_id)
-            
-            # Check if category has specific response time
-            if hasattr(client_config.response_times, category):
-                return getattr(client_config.response_times, category)
-            
-            # Fallback to general
-            return client_config.response_times.general
-            
+            return self.get_client_config(client_id).response_times.for_category(category)
         except ClientLoadError as e:
             logger.error(f"Failed to get response time: {e}")
             return "within 24 hours"  # Safe fallback
@@ -421,21 +517,16 @@ class EnhancedClientManager:
         if not domain:
             return []
         
-        client_similarities = []
-        
+        # One pass over all known domains, keeping each client's best score
+        best_by_client: Dict[str, float] = {}
         for client_id, client_domains in self._client_to_domains_cache.items():
-            max_similarity = 0.0
-            
             for client_domain in client_domains:
                 similarity = calculate_domain_similarity(domain, client_domain)
-                max_similarity = max(max_similarity, similarity)
-            
-            if max_similarity > 0.3:  # Only include reasonably similar clients
-                client_similarities.append((client_id, max_similarity))
+                if similarity > best_by_client.get(client_id, 0.3):  # Only reasonably similar clients
+                    best_by_client[client_id] = similarity
         
-        # Sort by similarity and return top results
-        client_similarities.sort(key=lambda x: x[1], reverse=True)
-        return client_similarities[:limit]
+        # Top results by similarity
+        return heapq.nlargest(limit, best_by_client.items(), key=lambda x: x[1])
     
     def add_domain_alias(self, alias_domain: str, canonical_domain: str):
         """
@@ -446,6 +537,7 @@ class EnhancedClientManager:
             canonical_domain: Canonical domain to map to
         """
         self._domain_matcher.add_alias(alias_domain, canonical_domain)
+        self._identification_cache.clear()
         logger.info(f"Added domain alias: {alias_domain} -> {canonical_domain}")
     
     def refresh_client(self, client_id: str):
@@ -506,10 +598,8 @@ class EnhancedClientManager:
                 return False
             
             # Check required routing categories
-            required_categories = ['support', 'billing', 'sales', 'general']
-            for category in required_categories:
-                if category not in routing_rules.routing:
-                    logger.warning(f"Missing routing rule for {category} in {client_id}")
+            for category in sorted(REQUIRED_ROUTING_CATEGORIES.difference(routing_rules.routing)):
+                logger.warning(f"Missing routing rule for {category} in {client_id}")
             
             # Validate domains
             domains = self.get_client_domains(client_id)
@@ -564,6 +654,12 @@ class EnhancedClientManager:
 ClientManager = EnhancedClientManager
 
 
-def get_client_manager():
-    """Dependency injection function for ClientManager."""
-    return EnhancedClientManager() 
\ No newline at end of file
+@lru_cache(maxsize=1)
+def get_client_manager() -> EnhancedClientManager:
+    """
+    Dependency injection function for ClientManager.
+    
+    Returns a process-wide instance so the domain mapping is built once,
+    not on every request. Use get_client_manager.cache_clear() to reset it.
+    """
+    return EnhancedClientManager()
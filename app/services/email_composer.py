@@ -3,16 +3,50 @@ AI-powered email response generation with multi-tenant support.
 ✍️ Creates personalized response drafts using client-specific AI prompts.
 """
 
+import asyncio
 import logging
-import httpx
-from typing import Dict, Any, Optional
+import orjson
+from types import MappingProxyType
+from typing import Dict, Any, AsyncIterator, Mapping, Optional, Tuple
 
 from ..utils.config import get_config
+from ..utils.email_text import prompt_body
 from ..services.client_manager import ClientManager, get_client_manager
 from ..services.template_engine import TemplateEngine
+from ..services.anthropic_batcher import send_message
+from ..services.anthropic_client import stream_message, user_content
 
 logger = logging.getLogger(__name__)
 
+# Hard-coded acknowledgments by category, used when all else fails
+_FALLBACK_ACKNOWLEDGMENTS: Mapping[str, str] = MappingProxyType({
+    "support": "Thank you for contacting our support team. We've received your technical inquiry and our team will respond within 4 hours during business hours.",
+    "billing": "Thank you for your billing inquiry. Our accounting team has been notified and will review your request within 24 hours.",
+    "sales": "Thank you for your interest in our services. Our sales team will contact you within 2 hours during business hours to discuss your needs.",
+    "general": "Thank you for contacting us. We've received your message and will respond within 24 hours."
+})
+
+# Output token budgets; generation time grows with the tokens allowed
+ACKNOWLEDGMENT_MAX_TOKENS = 250  # Acknowledgments are asked to stay under 150 words
+TEAM_ANALYSIS_MAX_TOKENS = 400
+
+_COMBINED_PROMPT_HEADER = """You will complete two independent writing tasks about the same email, each starting with a line "=== TASK: <name> ===".
+Follow only the instructions inside each task.
+
+Respond with ONLY a JSON object with exactly two string fields: "acknowledgment" holding the result of the ACKNOWLEDGMENT task and "team_analysis" holding the result of the TEAM ANALYSIS task. Do not include any other text.
+"""
+
+# Shared template engine; templates themselves are cached by the client loader
+_template_engine: Optional[TemplateEngine] = None
+
+
+def _get_template_engine() -> TemplateEngine:
+    """Get the shared template engine, creating it on first use."""
+    global _template_engine
+    if _template_engine is None:
+        _template_engine = TemplateEngine(get_client_manager())
+    return _template_engine
+
 
 async def generate_customer_acknowledgment(email_data: Dict[str, Any], classification: Dict[str, Any],
                                          client_id: Optional[str] = None) -> str:
@@ -30,11 +64,11 @@ async def generate_customer_acknowledgment(email_data: Dict[str, Any], classific
     try:
         # Get client manager and template engine
         client_manager = get_client_manager()
-        template_engine = TemplateEngine(client_manager)
+        template_engine = _get_template_engine()
         
         # Identify client if not provided
         if not client_id:
-            client_id = client_manager.identify_client_by_email(
+            client_id = client_manager.identify_client_by_email_simple(
                 email_data.get('to') or email_data.get('recipient', '')
             )
         
@@ -42,7 +76,7 @@ async def generate_customer_acknowledgment(email_data: Dict[str, Any], classific
             # Use client-specific template
             try:
                 prompt = template_engine.compose_acknowledgment_prompt(client_id, email_data, classification)
-                acknowledgment = await _call_ai_service(prompt)
+                acknowledgment = await _call_ai_service(prompt, ACKNOWLEDGMENT_MAX_TOKENS, batch=False)
                 
                 logger.info(f"✍️ Generated client-specific acknowledgment for {client_id}")
                 return acknowledgment
@@ -63,11 +97,65 @@ async def generate_customer_acknowledgment(email_data: Dict[str, Any], classific
         return _get_hard_fallback_acknowledgment(classification)
 
 
+async def generate_customer_acknowledgment_stream(email_data: Dict[str, Any], classification: Dict[str, Any],
+                                                 client_id: Optional[str] = None) -> AsyncIterator[str]:
+    """
+    ✍️ Stream a customer acknowledgment as Claude writes it.
+    
+    For consumers that can use partial text (e.g. a live draft preview), so
+    they see the first words after time-to-first-token rather than after the
+    whole generation. If the AI call fails before any text arrives, the
+    fallback acknowledgment is yielded instead.
+    
+    Args:
+        email_data: Email data from webhook
+        classification: Email classification result
+        client_id: Optional client ID (will be identified if not provided)
+        
+    Yields:
+        Acknowledgment text fragments
+    """
+    template_engine = _get_template_engine()
+    if not client_id:
+        client_id = get_client_manager().identify_client_by_email_simple(
+            email_data.get('to') or email_data.get('recipient', '')
+        )
+    
+    try:
+        if client_id:
+            prompt = template_engine.compose_acknowledgment_prompt(client_id, email_data, classification)
+        else:
+            prompt = _generic_acknowledgment_prompt(email_data, classification)
+    except Exception as e:
+        logger.error(f"❌ Acknowledgment prompt composition failed: {e}")
+        yield _get_hard_fallback_acknowledgment(classification)
+        return
+    
+    started = False
+    try:
+        async for text in stream_message(_message_payload(prompt, ACKNOWLEDGMENT_MAX_TOKENS)):
+            started = True
+            yield text
+    except Exception as e:
+        if started:
+            raise
+        logger.warning(f"Streaming acknowledgment failed for {client_id}: {e}")
+        if client_id:
+            yield template_engine.get_fallback_response(
+                client_id, 'customer_acknowledgments', classification.get('category', 'general')
+            )
+        else:
+            yield _get_hard_fallback_acknowledgment(classification)
+
+
 async def generate_team_analysis(email_data: Dict[str, Any], classification: Dict[str, Any],
                                 client_id: Optional[str] = None) -> str:
     """
     ✍️ Generate detailed team analysis using client-specific templates.
     
+    The analysis is read by the team later, so with ANTHROPIC_MESSAGE_BATCHES
+    enabled it is generated through a message batch at batch pricing.
+    
     Args:
         email_data: Email data from webhook
         classification: Email classification result
@@ -79,11 +167,11 @@ async def generate_team_analysis(email_data: Dict[str, Any], classification: Dic
     try:
         # Get client manager and template engine
         client_manager = get_client_manager()
-        template_engine = TemplateEngine(client_manager)
+        template_engine = _get_template_engine()
         
         # Identify client if not provided
         if not client_id:
-            client_id = client_manager.identify_client_by_email(
+            client_id = client_manager.identify_client_by_email_simple(
                 email_data.get('to') or email_data.get('recipient', '')
             )
         
@@ -91,7 +179,7 @@ async def generate_team_analysis(email_data: Dict[str, Any], classification: Dic
             # Use client-specific template
             try:
                 prompt = template_engine.compose_team_analysis_prompt(client_id, email_data, classification)
-                analysis = await _call_ai_service(prompt)
+                analysis = await _call_ai_service(prompt, TEAM_ANALYSIS_MAX_TOKENS)
                 
                 logger.info(f"✍️ Generated client-specific team analysis for {client_id}")
                 return analysis
@@ -112,12 +200,109 @@ async def generate_team_analysis(email_data: Dict[str, Any], classification: Dic
         return _get_hard_fallback_team_analysis(classification)
 
 
-async def _call_ai_service(prompt: str) -> str:
+async def generate_email_responses(email_data: Dict[str, Any], classification: Dict[str, Any],
+                                   client_id: Optional[str] = None) -> Tuple[str, str]:
+    """
+    ✍️ Generate the customer acknowledgment and team analysis concurrently.
+    
+    Both only depend on the classification, so their AI calls overlap and the
+    compose stage takes as long as the slower of the two. With
+    COMPOSER_SINGLE_CALL enabled, identified clients get both texts from one
+    AI call instead, halving request count at the cost of generating the two
+    texts back to back; the concurrent calls remain the fallback.
+    
+    Args:
+        email_data: Email data from webhook
+        classification: Email classification result
+        client_id: Optional client ID (will be identified if not provided)
+        
+    Returns:
+        Tuple of (acknowledgment, team_analysis); a failed branch gets its hard fallback text
+    """
+    # Identify the client once rather than in each concurrent generator
+    if not client_id:
+        client_id = get_client_manager().identify_client_by_email_simple(
+            email_data.get('to') or email_data.get('recipient', '')
+        )
+    
+    if get_config().composer_single_call and client_id:
+        try:
+            return await _generate_combined(email_data, classification, client_id)
+        except Exception as e:
+            logger.warning(f"Combined response generation failed for {client_id}, "
+                           f"generating separately: {e}")
+    
+    acknowledgment, analysis = await asyncio.gather(
+        generate_customer_acknowledgment(email_data, classification, client_id),
+        generate_team_analysis(email_data, classification, client_id),
+        return_exceptions=True
+    )
+    
+    if isinstance(acknowledgment, Exception):
+        logger.error(f"❌ Acknowledgment generation failed: {acknowledgment}")
+        acknowledgment = _get_hard_fallback_acknowledgment(classification)
+    if isinstance(analysis, Exception):
+        logger.error(f"❌ Team analysis generation failed: {analysis}")
+        analysis = _get_hard_fallback_team_analysis(classification)
+    
+    return acknowledgment, analysis
+
+
+async def _generate_combined(email_data: Dict[str, Any], classification: Dict[str, Any],
+                             client_id: str) -> Tuple[str, str]:
+    """
+    Generate the acknowledgment and team analysis with a single AI call.
+    
+    Args:
+        email_data: Email data from webhook
+        classification: Email classification result
+        client_id: Client identifier
+        
+    Returns:
+        Tuple of (acknowledgment, team_analysis)
+        
+    Raises:
+        ValueError: If the AI response is not a JSON object with both texts
+    """
+    template_engine = _get_template_engine()
+    prompt = "\n".join((
+        _COMBINED_PROMPT_HEADER,
+        "=== TASK: ACKNOWLEDGMENT ===",
+        template_engine.compose_acknowledgment_prompt(client_id, email_data, classification).strip(),
+        "",
+        "=== TASK: TEAM ANALYSIS ===",
+        template_engine.compose_team_analysis_prompt(client_id, email_data, classification).strip()
+    ))
+    
+    # The acknowledgment is customer-facing, so the combined call is never batched
+    ai_response = await send_message(
+        _message_payload(prompt, ACKNOWLEDGMENT_MAX_TOKENS + TEAM_ANALYSIS_MAX_TOKENS), batch=False
+    )
+    
+    try:
+        result = orjson.loads(ai_response)
+    except orjson.JSONDecodeError as e:
+        raise ValueError(f"Invalid combined AI response format: {e}")
+    
+    acknowledgment = result.get('acknowledgment') if isinstance(result, dict) else None
+    analysis = result.get('team_analysis') if isinstance(result, dict) else None
+    if not (isinstance(acknowledgment, str) and acknowledgment.strip()
+            and isinstance(analysis, str) and analysis.strip()):
+        raise ValueError("Combined AI response is missing the acknowledgment or team analysis")
+    
+    logger.info(f"✍️ Generated acknowledgment and team analysis in one call for {client_id}")
+    return acknowledgment.strip(), analysis.strip()
+
+
+async def _call_ai_service(prompt: str, max_tokens: int = TEAM_ANALYSIS_MAX_TOKENS,
+                           batch: bool = True) -> str:
     """
     Call Anthropic Claude API with prompt.
     
     Args:
         prompt: AI prompt to send
+        max_tokens: Output token budget
+        batch: Whether the call may wait for a message batch (False for customer-facing text)
         
     Returns:
         AI response text
@@ -125,36 +310,36 @@ async def _call_ai_service(prompt: str) -> str:
     Raises:
         Exception: If AI service call fails
     """
-    config = get_config()
-    
-    async with httpx.AsyncClient() as client:
-        response = await client.post(
-            "https://api.anthropic.com/v1/messages",
-            headers={
-                "Content-Type": "application/json",
-                "x-api-key": config.anthropic_api_key,
-                "anthropic-version": "2023-06-01"
-            },
-            json={
-                "model": config.anthropic_model,
-                "max_tokens": 400,  # Reasonable size for responses
-                "temperature": 0.3,  # Lower temperature for consistency
-                "messages": [{"role": "user", "content": prompt}]
-            },
-            timeout=30.0
-        )
-        
-        response.raise_for_status()
-        result = response.json()
-        
-        return result["content"][0]["text"].strip()
+    response_text = await send_message(_message_payload(prompt, max_tokens), batch=batch)
+    return response_text.strip()
+
+
+def _message_payload(prompt: str, max_tokens: int) -> Dict[str, Any]:
+    """Build the Messages API request body for a response-generation prompt."""
+    return {
+        "model": get_config().anthropic_model,
+        "max_tokens": max_tokens,
+        "temperature": 0.3,  # Lower temperature for consistency
+        "messages": [{"role": "user", "content": user_content(prompt)}]
+    }
 
 
 async def _generate_generic_acknowledgment(email_data: Dict[str, Any], classification: Dict[str, Any]) -> str:
     """Generate generic acknowledgment when no client is identified."""
+    prompt = _generic_acknowledgment_prompt(email_data, classification)
+    
+    try:
+        return await _call_ai_service(prompt, ACKNOWLEDGMENT_MAX_TOKENS, batch=False)
+    except Exception as e:
+        logger.error(f"Generic acknowledgment generation failed: {e}")
+        return _get_hard_fallback_acknowledgment(classification)
+
+
+def _generic_acknowledgment_prompt(email_data: Dict[str, Any], classification: Dict[str, Any]) -> str:
+    """Build the acknowledgment prompt used when no client is identified."""
     category = classification.get('category', 'general')
     
-    prompt = f"""
+    return f"""
 Generate a brief professional acknowledgment for a {category} inquiry.
 
 Email subject: {email_data.get('subject', '')}
@@ -168,12 +353,6 @@ Generate a SHORT acknowledgment that:
 
 Acknowledgment:
 """
-    
-    try:
-        return await _call_ai_service(prompt)
-    except Exception as e:
-        logger.error(f"Generic acknowledgment generation failed: {e}")
-        return _get_hard_fallback_acknowledgment(classification)
 
 
 async def _generate_generic_team_analysis(email_data: Dict[str, Any], classification: Dict[str, Any]) -> str:
@@ -187,7 +366,7 @@ Analyze this email for the team member who will handle it.
 Email details:
 From: {email_data.get('from', '')}
 Subject: {email_data.get('subject', '')}
-Message: {email_data.get('stripped_text') or email_data.get('body_text', '')}
+Message: {prompt_body(email_data)}
 
 Classification: {category} (confidence: {confidence:.2f})
 
@@ -201,7 +380,7 @@ Team Analysis:
 """
     
     try:
-        return await _call_ai_service(prompt)
+        return await _call_ai_service(prompt, TEAM_ANALYSIS_MAX_TOKENS)
     except Exception as e:
         logger.error(f"Generic team analysis generation failed: {e}")
         return _get_hard_fallback_team_analysis(classification)
@@ -210,15 +389,7 @@ Team Analysis:
 def _get_hard_fallback_acknowledgment(classification: Dict[str, Any]) -> str:
     """Get hard-coded fallback acknowledgment when all else fails."""
     category = classification.get('category', 'general')
-    
-    fallbacks = {
-        "support": "Thank you for contacting our support team. We've received your technical inquiry and our team will respond within 4 hours during business hours.",
-        "billing": "Thank you for your billing inquiry. Our accounting team has been notified and will review your request within 24 hours.",
-        "sales": "Thank you for your interest in our services. Our sales team will contact you within 2 hours during business hours to discuss your needs.",
-        "general": "Thank you for contacting us. We've received your message and will respond within 24 hours."
-    }
-    
-    return fallbacks.get(category, fallbacks["general"])
+    return _FALLBACK_ACKNOWLEDGMENTS.get(category, _FALLBACK_ACKNOWLEDGMENTS["general"])
 
 
 def _get_hard_fallback_team_analysis(classification: Dict[str, Any]) -> str:
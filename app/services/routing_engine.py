@@ -5,12 +5,14 @@ Dynamic email routing engine using client-specific rules.
 
 import logging
 from typing import Dict, Any, Optional, List
-from datetime import datetime, time, timedelta
+from datetime import datetime, time, timedelta, timezone
 import pytz
+from fastapi import Depends
 
-from ..services.client_manager import ClientManager
+from ..services.client_manager import ClientManager, get_client_manager
 from ..models.client_config import ClientConfig, RoutingRules
 from ..utils.domain_resolver import extract_domain_from_email
+from ..utils.timestamps import utc_timestamp
 
 logger = logging.getLogger(__name__)
 
@@ -96,7 +98,7 @@ class RoutingEngine:
                 'business_hours_applied': final_destination != primary_destination,
                 'confidence_level': self._get_confidence_level(confidence),
                 'special_handling': self._get_special_handling(client_id, email_data, routing_rules),
-                'timestamp': datetime.utcnow().isoformat()
+                'timestamp': utc_timestamp()
             }
             
             logger.info(f"📍 Routed {category} email for {client_id} to {final_destination}")
@@ -138,7 +140,7 @@ class RoutingEngine:
                         'escalation_reason': f"Keyword '{keyword}' detected",
                         'reason': f"Immediate escalation: keyword '{keyword}' detected",
                         'priority': 'urgent',
-                        'timestamp': datetime.utcnow().isoformat()
+                        'timestamp': utc_timestamp()
                     }
         
         # Check VIP domain escalation
@@ -156,7 +158,7 @@ class RoutingEngine:
                             'escalation_reason': f"VIP domain: {sender_domain}",
                             'reason': f"VIP routing: {sender_domain}",
                             'priority': 'high',
-                            'timestamp': datetime.utcnow().isoformat()
+                            'timestamp': utc_timestamp()
                         }
         
         # Check confidence-based escalation
@@ -172,7 +174,7 @@ class RoutingEngine:
                     'escalation_reason': f"Low classification confidence: {confidence:.2f}",
                     'reason': f"Low confidence escalation: {confidence:.2f}",
                     'priority': 'medium',
-                    'timestamp': datetime.utcnow().isoformat()
+                    'timestamp': utc_timestamp()
                 }
             except Exception as e:
                 logger.warning(f"Failed to get escalation contact for low confidence: {e}")
@@ -359,8 +361,8 @@ class RoutingEngine:
         Returns:
             ISO timestamp for escalation time
         """
-        escalation_time = datetime.utcnow() + datetime.timedelta(hours=hours_after)
-        return escalation_time.isoformat()
+        escalation_time = datetime.now(timezone.utc) + timedelta(hours=hours_after)
+        return escalation_time.strftime("%Y-%m-%dT%H:%M:%S")
     
     def _get_confidence_level(self, confidence: float) -> str:
         """
@@ -453,7 +455,7 @@ class RoutingEngine:
                 'confidence_level': 'unknown',
                 'special_handling': ['fallback_routing'],
                 'error': 'Normal routing failed, using fallback',
-                'timestamp': datetime.utcnow().isoformat()
+                'timestamp': utc_timestamp()
             }
             
         except Exception as e:
@@ -468,7 +470,7 @@ class RoutingEngine:
                 'confidence_level': 'unknown',
                 'special_handling': ['hard_fallback'],
                 'error': 'All routing methods failed',
-                'timestamp': datetime.utcnow().isoformat()
+                'timestamp': utc_timestamp()
             }
     
     def get_routing_analytics(self, client_id: str, time_period_hours: int = 24) -> Dict[str, Any]:
@@ -495,10 +497,7 @@ class RoutingEngine:
         }
 
 
-def get_routing_engine(client_manager: ClientManager = None):
+def get_routing_engine(client_manager: ClientManager = Depends(get_client_manager)):
     """Dependency injection function for RoutingEngine."""
-    if client_manager is None:
-        from .client_manager import get_client_manager
-        client_manager = get_client_manager()
-    
-    return RoutingEngine(client_manager) 
\ No newline at end of file
+    return RoutingEngine(client_manager)
+ 
\ No newline at end of file
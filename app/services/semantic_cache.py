@@ -0,0 +1,114 @@
+"""
+Semantic cache for near-duplicate email classifications.
+🧲 Matches new emails against recent ones by embedding similarity.
+"""
+
+import logging
+from typing import Any, Dict, List, Optional
+
+# Optional dependencies: the semantic tier is skipped when they are not installed
+try:
+    import numpy as np
+    from fastembed import TextEmbedding
+    SEMANTIC_CACHE_AVAILABLE = True
+except ImportError:
+    SEMANTIC_CACHE_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+
+class SemanticCache:
+    """
+    Fixed-size store of email embeddings and their classifications.
+    
+    Embeddings are kept normalized in a single matrix so a lookup is one
+    matrix-vector product. When full, the oldest entry is overwritten.
+    """
+    
+    def __init__(self, threshold: float = 0.92, max_entries: int = 2048,
+                 model_name: str = DEFAULT_EMBEDDING_MODEL):
+        """
+        Initialize semantic cache.
+        
+        Args:
+            threshold: Minimum cosine similarity for a cache hit
+            max_entries: Maximum number of cached classifications
+            model_name: fastembed model used to embed email text
+        """
+        if not SEMANTIC_CACHE_AVAILABLE:
+            raise RuntimeError("Semantic cache requires numpy and fastembed")
+        
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.model_name = model_name
+        
+        self._model: Optional["TextEmbedding"] = None
+        self._vectors: Optional["np.ndarray"] = None
+        self._entries: List[Optional[Dict[str, Any]]] = [None] * max_entries
+        self._count = 0
+        self._next = 0
+    
+    def embed(self, text: str) -> "np.ndarray":
+        """
+        Embed text into a normalized vector.
+        
+        CPU-bound: call from a worker thread in async code.
+        
+        Args:
+            text: Email text (subject and leading body)
+            
+        Returns:
+            Unit-length embedding vector
+        """
+        if self._model is None:
+            logger.info(f"Loading embedding model {self.model_name}")
+            self._model = TextEmbedding(model_name=self.model_name)
+        
+        vector = np.asarray(next(iter(self._model.embed([text]))), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+    
+    def lookup(self, vector: "np.ndarray") -> Optional[Dict[str, Any]]:
+        """
+        Find the cached classification most similar to a vector.
+        
+        Args:
+            vector: Normalized query embedding
+            
+        Returns:
+            Cached classification if similarity meets the threshold, None otherwise
+        """
+        if self._count == 0:
+            return None
+        
+        similarities = self._vectors[:self._count] @ vector
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.threshold:
+            return None
+        
+        logger.debug(f"Semantic cache hit (similarity: {similarities[best]:.3f})")
+        return self._entries[best]
+    
+    def add(self, vector: "np.ndarray", classification: Dict[str, Any]):
+        """
+        Store a classification, replacing the oldest entry when full.
+        
+        Args:
+            vector: Normalized embedding of the classified email
+            classification: Classification result to cache
+        """
+        if self._vectors is None:
+            self._vectors = np.zeros((self.max_entries, vector.shape[0]), dtype=np.float32)
+        
+        self._vectors[self._next] = vector
+        self._entries[self._next] = classification
+        self._next = (self._next + 1) % self.max_entries
+        self._count = min(self._count + 1, self.max_entries)
+    
+    def clear(self):
+        """Drop all cached classifications."""
+        self._entries = [None] * self.max_entries
+        self._count = 0
+        self._next = 0
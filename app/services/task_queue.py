@@ -0,0 +1,81 @@
+"""
+Optional Redis-backed task queue for the email pipeline.
+📬 Hands inbound emails to arq workers so processing survives redeploys and scales out.
+"""
+
+import logging
+from typing import Any, Dict, Optional
+
+# Optional dependency: without arq (or REDIS_URL) the pipeline runs in-process
+try:
+    from arq import create_pool
+    from arq.connections import ArqRedis, RedisSettings
+    ARQ_AVAILABLE = True
+except ImportError:
+    ARQ_AVAILABLE = False
+
+from ..utils.config import get_config
+
+logger = logging.getLogger(__name__)
+
+# Job name registered by app.worker.WorkerSettings
+PROCESS_EMAIL_JOB = "process_email"
+
+_pool: Optional["ArqRedis"] = None
+
+
+async def open_queue() -> bool:
+    """
+    Connect to the task queue if one is configured.
+    
+    Returns:
+        True if jobs will be enqueued, False if the pipeline runs in-process
+    """
+    global _pool
+    if _pool is not None:
+        return True
+    
+    redis_url = get_config().redis_url
+    if not redis_url:
+        return False
+    if not ARQ_AVAILABLE:
+        logger.warning("REDIS_URL is set but arq is not installed; processing emails in-process")
+        return False
+    
+    try:
+        _pool = await create_pool(RedisSettings.from_dsn(redis_url))
+        logger.info("📬 Email pipeline jobs will be enqueued to Redis")
+        return True
+    except Exception as e:
+        logger.error(f"Failed to connect to task queue, processing emails in-process: {e}")
+        return False
+
+
+async def close_queue():
+    """Close the task queue connection."""
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
+
+
+async def enqueue_email(email_data: Dict[str, Any], client_id: Optional[str]) -> bool:
+    """
+    Enqueue an email for processing by a worker.
+    
+    Args:
+        email_data: Email data extracted from the webhook
+        client_id: Identified client ID, if any
+        
+    Returns:
+        True if the job was enqueued, False if the caller should process it in-process
+    """
+    if _pool is None:
+        return False
+    
+    try:
+        await _pool.enqueue_job(PROCESS_EMAIL_JOB, email_data, client_id)
+        return True
+    except Exception as e:
+        logger.error(f"Failed to enqueue email, processing in-process: {e}")
+        return False
@@ -5,15 +5,50 @@ Template engine for AI prompt composition with client-specific context.
 
 import logging
 import re
-from typing import Dict, Any, Optional
+from functools import lru_cache
+from typing import Collection, Dict, Any, Optional, Tuple
 from string import Template
 
 from ..services.client_manager import ClientManager
-from ..utils.client_loader import load_ai_prompt, load_fallback_responses, ClientLoadError
-from ..models.client_config import ClientConfig
+from ..services.anthropic_client import CacheablePrompt
+from ..utils.email_text import prompt_body
+from ..utils.client_loader import load_ai_prompt, load_fallback_responses, clear_cache, ClientLoadError
+from ..models.client_config import ClientConfig, RoutingRules
 
 logger = logging.getLogger(__name__)
 
+# Prompt templates every client provides under ai-context/
+TEMPLATE_TYPES = ('classification', 'acknowledgment', 'team-analysis')
+
+# {{variable.path}} or {variable}; JSON examples in templates never match the latter
+_VARIABLE_RE = re.compile(r'\{\{([^}]+)\}\}|\{(\w+)\}')
+
+# Anthropic only caches prompt prefixes of at least 1024 tokens (about 4 characters each)
+MIN_CACHEABLE_PROMPT_CHARS = 4096
+
+# Client-level template context (nested and flattened), keyed by client ID. Entries
+# remember the config objects they were built from and are rebuilt when those change.
+_static_context_cache: Dict[str, Tuple[ClientConfig, RoutingRules, Dict[str, Any], Dict[str, str]]] = {}
+
+
+@lru_cache(maxsize=256)
+def _compile_template(template: str) -> Tuple[Tuple[str, Optional[str], Optional[str]], ...]:
+    """
+    Split a template into literal text and the variables between it.
+    
+    Templates come from the loader cache, so each one is scanned once rather
+    than on every prompt.
+    
+    Args:
+        template: Template string
+        
+    Returns:
+        (literal, path, name) triples: the literal text, then the {{variable.path}}
+        or {variable} that follows it (both None after the final literal)
+    """
+    parts = _VARIABLE_RE.split(template) + [None, None]
+    return tuple(tuple(parts[index:index + 3]) for index in range(0, len(parts) - 2, 3))
+
 
 class TemplateEngine:
     """
@@ -31,7 +66,33 @@ class TemplateEngine:
             client_manager: ClientManager instance for accessing client data
         """
         self.client_manager = client_manager
-        self._template_cache: Dict[str, str] = {}
+    
+    def preload_all(self) -> int:
+        """
+        Load every client's prompt templates and fallback responses into the loader cache.
+        
+        Intended to run once at startup so the first email for each client
+        does not wait on template file reads.
+        
+        Returns:
+            Number of template files loaded
+        """
+        loaded = 0
+        for client_id in self.client_manager.get_available_clients():
+            for template_type in TEMPLATE_TYPES:
+                try:
+                    load_ai_prompt(client_id, template_type)
+                    loaded += 1
+                except ClientLoadError as e:
+                    logger.warning(f"Failed to preload {template_type} template for {client_id}: {e}")
+            try:
+                load_fallback_responses(client_id)
+                loaded += 1
+            except ClientLoadError as e:
+                logger.warning(f"Failed to preload fallback responses for {client_id}: {e}")
+        
+        logger.info(f"Preloaded {loaded} template files")
+        return loaded
     
     def _load_template(self, client_id: str, template_type: str) -> str:
         """
@@ -47,21 +108,79 @@ class TemplateEngine:
         Raises:
             ClientLoadError: If template cannot be loaded
         """
-        cache_key = f"{client_id}_{template_type}"
-        
-        # Check cache first
-        if cache_key in self._template_cache:
-            return self._template_cache[cache_key]
-        
         try:
-            template_content = load_ai_prompt(client_id, template_type)
-            self._template_cache[cache_key] = template_content
-            return template_content
+            # Cached by the loader until the template file changes on disk
+            return load_ai_prompt(client_id, template_type)
             
         except ClientLoadError as e:
             logger.error(f"Failed to load {template_type} template for {client_id}: {e}")
             raise
     
+    def _static_context(self, client_id: str) -> Tuple[Dict[str, Any], Dict[str, str]]:
+        """
+        Get the client-level template context, building it only when the client's configuration changes.
+        
+        Args:
+            client_id: Client identifier
+            
+        Returns:
+            Tuple of (nested context, flattened context); both are shared and must not be modified
+        """
+        client_config = self.client_manager.get_client_config(client_id)
+        routing_rules = self.client_manager.get_routing_rules(client_id)
+        
+        cached = _static_context_cache.get(client_id)
+        if cached is not None and cached[0] is client_config and cached[1] is routing_rules:
+            return cached[2], cached[3]
+        
+        context = self._build_static_context(client_config, routing_rules)
+        flat_context = self._flatten_context(context)
+        _static_context_cache[client_id] = (client_config, routing_rules, context, flat_context)
+        return context, flat_context
+    
+    @staticmethod
+    def _build_static_context(client_config: ClientConfig, routing_rules: RoutingRules) -> Dict[str, Any]:
+        """Build the template context derived from client configuration alone."""
+        return {
+            'client': {
+                'id': client_config.client.id,
+                'name': client_config.client.name,
+                'industry': client_config.client.industry,
+                'timezone': client_config.client.timezone,
+                'business_hours': client_config.client.business_hours,
+            },
+            'branding': {
+                'company_name': client_config.branding.company_name,
+                'email_signature': client_config.branding.email_signature,
+                'primary_color': client_config.branding.primary_color,
+                'secondary_color': client_config.branding.secondary_color,
+            },
+            'response_times': {
+                'support': client_config.response_times.support,
+                'billing': client_config.response_times.billing,
+                'sales': client_config.response_times.sales,
+                'general': client_config.response_times.general,
+            },
+            'routing': routing_rules.routing,
+            'domains': {
+                'primary': client_config.domains.primary,
+                'support': client_config.domains.support,
+                'mailgun': client_config.domains.mailgun,
+            }
+        }
+    
+    @staticmethod
+    def _email_context(email_data: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """Template variables taken from the email itself."""
+        if not email_data:
+            return {}
+        return {
+            'sender': email_data.get('from', ''),
+            'subject': email_data.get('subject', ''),
+            'body': prompt_body(email_data),
+            'recipient': email_data.get('to', ''),
+        }
+    
     def _prepare_template_context(self, client_id: str, email_data: Dict[str, Any] = None) -> Dict[str, Any]:
         """
         Prepare context data for template injection.
@@ -74,53 +193,43 @@ class TemplateEngine:
             Dictionary of context data for template injection
         """
         try:
-            client_config = self.client_manager.get_client_config(client_id)
-            routing_rules = self.client_manager.get_routing_rules(client_id)
-            
-            # Base context with client configuration
-            context = {
-                'client': {
-                    'id': client_config.client.id,
-                    'name': client_config.client.name,
-                    'industry': client_config.client.industry,
-                    'timezone': client_config.client.timezone,
-                    'business_hours': client_config.client.business_hours,
-                },
-                'branding': {
-                    'company_name': client_config.branding.company_name,
-                    'email_signature': client_config.branding.email_signature,
-                    'primary_color': client_config.branding.primary_color,
-                    'secondary_color': client_config.branding.secondary_color,
-                },
-                'response_times': {
-                    'support': client_config.response_times.support,
-                    'billing': client_config.response_times.billing,
-                    'sales': client_config.response_times.sales,
-                    'general': client_config.response_times.general,
-                },
-                'routing': routing_rules.routing,
-                'domains': {
-                    'primary': client_config.domains.primary,
-                    'support': client_config.domains.support,
-                    'mailgun': client_config.domains.mailgun,
-                }
-            }
-            
-            # Add email data if provided
-            if email_data:
-                context.update({
-                    'sender': email_data.get('from', ''),
-                    'subject': email_data.get('subject', ''),
-                    'body': email_data.get('stripped_text') or email_data.get('body_text', ''),
-                    'recipient': email_data.get('to', ''),
-                })
-            
-            return context
+            context, _ = self._static_context(client_id)
+            return {**context, **self._email_context(email_data)}
             
         except Exception as e:
             logger.error(f"Failed to prepare template context for {client_id}: {e}")
             raise
     
+    def _render(self, client_id: str, template: str, variables: Dict[str, Any]) -> str:
+        """
+        Inject client context and per-email variables into a template.
+        
+        Equivalent to _inject_template_variables over the full context, but
+        reuses the client's cached flattened context and the compiled template.
+        
+        Args:
+            client_id: Client identifier
+            template: Template string with variables
+            variables: Per-email scalar variables (subject, category, ...)
+            
+        Returns:
+            Template with variables injected; a CacheablePrompt when the text
+            before the first per-email variable is long enough for prompt caching
+        """
+        static_context, static_flat = self._static_context(client_id)
+        context = {**static_context, **variables}
+        flat_context = {**static_flat, **{key: str(value) for key, value in variables.items()}}
+        
+        try:
+            prefix, rest = self._substitute(template, context, flat_context, variables)
+        except Exception as e:
+            logger.error(f"Error injecting template variables: {e}")
+            return template  # Return original template if injection fails
+        
+        if len(prefix) >= MIN_CACHEABLE_PROMPT_CHARS:
+            return CacheablePrompt(prefix + rest, len(prefix))
+        return prefix + rest
+    
     def _inject_template_variables(self, template: str, context: Dict[str, Any]) -> str:
         """
         Inject variables into template using both {{}} and {} syntax.
@@ -133,29 +242,47 @@ class TemplateEngine:
             Template with variables injected
         """
         try:
-            # First pass: Handle {{client.name}} style variables
-            def replace_double_braces(match):
-                var_path = match.group(1)
-                return self._get_nested_value(context, var_path)
-            
-            # Replace {{variable.path}} patterns
-            template = re.sub(r'\{\{([^}]+)\}\}', replace_double_braces, template)
-            
-            # Second pass: Handle {variable} style variables using string.Template
-            template_obj = Template(template)
-            
-            # Flatten context for simple variable substitution
-            flat_context = self._flatten_context(context)
-            
-            # Use safe_substitute to avoid KeyError for missing variables
-            result = template_obj.safe_substitute(flat_context)
-            
-            return result
+            prefix, rest = self._substitute(template, context, self._flatten_context(context))
+            return prefix + rest
             
         except Exception as e:
             logger.error(f"Error injecting template variables: {e}")
             return template  # Return original template if injection fails
     
+    def _substitute(self, template: str, context: Dict[str, Any], flat_context: Dict[str, str],
+                    dynamic: Collection[str] = ()) -> Tuple[str, str]:
+        """
+        Substitute {{variable.path}} from the nested context, {variable} from the flat one,
+        and $variable in the template's own text from the flat one.
+        
+        Inserted values are never rescanned, so a "$" in customer text stays as written.
+        
+        Args:
+            template: Template string with variables
+            context: Nested context for {{}} variables
+            flat_context: Flattened context for {} and $ variables
+            dynamic: Names of variables that change from email to email
+            
+        Returns:
+            Tuple of (text before the first dynamic variable, remaining text)
+        """
+        prefix, rest = [], []
+        parts = prefix
+        for literal, path, name in _compile_template(template):
+            # Handle $variable style variables; safe_substitute ignores missing ones
+            parts.append(Template(literal).safe_substitute(flat_context) if '$' in literal else literal)
+            if path is not None:
+                if parts is prefix and path.split('.', 1)[0] in dynamic:
+                    parts = rest
+                parts.append(self._get_nested_value(context, path))
+            elif name is not None:
+                if parts is prefix and name in dynamic:
+                    parts = rest
+                # Unknown names are left as written
+                parts.append(flat_context.get(name, f"{{{name}}}"))
+        
+        return "".join(prefix), "".join(rest)
+    
     def _get_nested_value(self, data: Dict[str, Any], path: str) -> str:
         """
         Get nested value from dictionary using dot notation.
@@ -219,9 +346,7 @@ class TemplateEngine:
         """
         try:
             template = self._load_template(client_id, 'classification')
-            context = self._prepare_template_context(client_id, email_data)
-            
-            prompt = self._inject_template_variables(template, context)
+            prompt = self._render(client_id, template, self._email_context(email_data))
             
             logger.debug(f"Composed classification prompt for {client_id} ({len(prompt)} chars)")
             return prompt
@@ -247,17 +372,15 @@ class TemplateEngine:
         """
         try:
             template = self._load_template(client_id, 'acknowledgment')
-            context = self._prepare_template_context(client_id, email_data)
             
-            # Add classification context
-            context.update({
+            # Email and classification context
+            prompt = self._render(client_id, template, {
+                **self._email_context(email_data),
                 'category': classification.get('category', 'general'),
                 'priority': classification.get('priority', 'medium'),
                 'confidence': classification.get('confidence', 0.5),
             })
             
-            prompt = self._inject_template_variables(template, context)
-            
             logger.debug(f"Composed acknowledgment prompt for {client_id} ({len(prompt)} chars)")
             return prompt
             
@@ -282,14 +405,14 @@ class TemplateEngine:
         """
         try:
             template = self._load_template(client_id, 'team-analysis')
-            context = self._prepare_template_context(client_id, email_data)
             
-            # Add classification and routing context
+            # Email, classification and routing context
             routing_destination = self.client_manager.get_routing_destination(
                 client_id, classification.get('category', 'general')
             )
             
-            context.update({
+            prompt = self._render(client_id, template, {
+                **self._email_context(email_data),
                 'category': classification.get('category', 'general'),
                 'priority': classification.get('priority', 'medium'),
                 'confidence': classification.get('confidence', 0.5),
@@ -297,8 +420,6 @@ class TemplateEngine:
                 'assigned_to': routing_destination,
             })
             
-            prompt = self._inject_template_variables(template, context)
-            
             logger.debug(f"Composed team analysis prompt for {client_id} ({len(prompt)} chars)")
             return prompt
             
@@ -353,7 +474,7 @@ Categories:
 
 Email:
 Subject: {email_data.get('subject', '')}
-Body: {email_data.get('stripped_text') or email_data.get('body_text', '')}
+Body: {prompt_body(email_data)}
 
 Respond in JSON format:
 {{
@@ -389,7 +510,12 @@ Please review the original message and respond accordingly.
         else:
             return "Email received and being processed."
     
-    def clear_cache(self):
-        """Clear template cache."""
-        self._template_cache.clear()
+    def clear_cache(self, client_id: Optional[str] = None):
+        """
+        Clear cached templates so they are re-read from disk.
+        
+        Args:
+            client_id: If provided, clear only this client's cached files
+        """
+        clear_cache(client_id)
         logger.info("Template cache cleared") 
\ No newline at end of file
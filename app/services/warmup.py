@@ -0,0 +1,26 @@
+"""
+Process warm-up shared by the API server and the queue worker.
+🔥 Loads every cache a first email would otherwise pay for.
+"""
+
+from .anthropic_client import warm_anthropic_connection, start_connection_keepalive
+from .client_manager import get_client_manager
+from .template_engine import TemplateEngine
+from ..utils.client_loader import preload_client_configs
+
+
+async def warm_caches():
+    """
+    Preload client configurations, the domain mapping and prompt templates, then
+    open the Anthropic connection and start its keep-alive.
+    
+    Called from both the FastAPI startup and the arq worker startup, so the two
+    entry points always warm the same things.
+    """
+    preload_client_configs()
+    client_manager = get_client_manager()
+    client_manager.initialize()
+    TemplateEngine(client_manager).preload_all()
+    # Connect to Anthropic now so the first classification skips the TLS handshake
+    await warm_anthropic_connection()
+    start_connection_keepalive()
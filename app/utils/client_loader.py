@@ -6,11 +6,18 @@ Client configuration loader with YAML validation and caching.
 import os
 import logging
 from pathlib import Path
-from typing import Dict, Optional, List
+from typing import Dict, Optional, List, Tuple
 from functools import lru_cache
 import yaml
+import orjson
 from pydantic import ValidationError
 
+# Prefer the LibYAML-backed C parser when PyYAML was built with it
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
 from ..models.client_config import (
     ClientConfig, 
     RoutingRules, 
@@ -23,10 +30,14 @@ logger = logging.getLogger(__name__)
 # Cache for loaded configurations
 _config_cache: Dict[str, Dict] = {}
 _file_timestamps: Dict[str, float] = {}
+_clients_listing: Optional[Tuple[float, List[str]]] = None
 
 # Base path for client configurations
 CLIENTS_BASE_PATH = Path("clients/active")
 
+# Write a parsed-JSON sibling (e.g. client-config.yaml.json) for faster reloads
+JSON_CACHE_ENABLED = os.environ.get("CLIENT_CONFIG_JSON_CACHE", "true").lower() != "false"
+
 
 class ClientLoadError(Exception):
     """Exception raised when client loading fails."""
@@ -37,26 +48,77 @@ def get_available_clients() -> List[str]:
     """
     Get list of available client IDs.
     
+    The directory scan is cached until the clients directory's mtime changes,
+    which happens whenever a client directory is added, removed, or renamed.
+    
     Returns:
         List of client IDs (directory names)
     """
-    if not CLIENTS_BASE_PATH.exists():
+    global _clients_listing
+    
+    dir_mtime = _get_file_mtime(CLIENTS_BASE_PATH)
+    if dir_mtime is None:
         logger.warning(f"Clients directory not found: {CLIENTS_BASE_PATH}")
         return []
     
+    if _clients_listing is not None and _clients_listing[0] == dir_mtime:
+        return list(_clients_listing[1])
+    
     clients = []
     for client_dir in CLIENTS_BASE_PATH.iterdir():
         if client_dir.is_dir() and client_dir.name.startswith('client-'):
             clients.append(client_dir.name)
     
+    _clients_listing = (dir_mtime, clients)
     logger.info(f"Found {len(clients)} available clients: {clients}")
-    return clients
+    return list(clients)
+
+
+def _json_cache_path(file_path: Path) -> Path:
+    """Get the path of the JSON cache written next to a YAML file."""
+    return file_path.with_name(file_path.name + ".json")
+
+
+def _read_json_cache(file_path: Path) -> Optional[Dict]:
+    """
+    Read the JSON cache for a YAML file if it is at least as new as the YAML.
+    
+    Args:
+        file_path: Path to the YAML file
+        
+    Returns:
+        Cached data, or None if there is no usable cache
+    """
+    json_path = _json_cache_path(file_path)
+    try:
+        if json_path.stat().st_mtime < file_path.stat().st_mtime:
+            return None
+        return orjson.loads(json_path.read_bytes())
+    except (OSError, orjson.JSONDecodeError):
+        return None
+
+
+def _write_json_cache(file_path: Path, data: Dict):
+    """
+    Write parsed YAML data to its JSON cache, ignoring failures.
+    
+    Args:
+        file_path: Path to the YAML file
+        data: Parsed YAML data
+    """
+    try:
+        _json_cache_path(file_path).write_bytes(orjson.dumps(data))
+    except (OSError, TypeError) as e:
+        logger.debug(f"Skipping JSON cache for {file_path}: {e}")
 
 
 def _load_yaml_file(file_path: Path) -> Dict:
     """
     Load and parse a YAML file.
     
+    A JSON copy of the parsed data is cached next to the file and reused
+    while it is newer than the YAML, since JSON parses much faster.
+    
     Args:
         file_path: Path to the YAML file
         
@@ -70,12 +132,21 @@ def _load_yaml_file(file_path: Path) -> Dict:
         if not file_path.exists():
             raise ClientLoadError(f"Configuration file not found: {file_path}")
         
+        if JSON_CACHE_ENABLED:
+            data = _read_json_cache(file_path)
+            if data is not None:
+                logger.debug(f"Loaded JSON cache for: {file_path}")
+                return data
+        
         with open(file_path, 'r', encoding='utf-8') as f:
-            data = yaml.safe_load(f)
+            data = yaml.load(f, Loader=SafeLoader)
         
         if data is None:
             raise ClientLoadError(f"Empty or invalid YAML file: {file_path}")
         
+        if JSON_CACHE_ENABLED:
+            _write_json_cache(file_path, data)
+        
         logger.debug(f"Loaded YAML file: {file_path}")
         return data
         
@@ -85,6 +156,22 @@ def _load_yaml_file(file_path: Path) -> Dict:
         raise ClientLoadError(f"Error loading {file_path}: {e}")
 
 
+def _get_file_mtime(file_path: Path) -> Optional[float]:
+    """
+    Get file modification time without raising.
+    
+    Args:
+        file_path: Path to check
+        
+    Returns:
+        Modification time, or None if the file cannot be stat'ed
+    """
+    try:
+        return file_path.stat().st_mtime
+    except OSError:
+        return None
+
+
 def _check_file_modified(file_path: Path) -> bool:
     """
     Check if file has been modified since last load.
@@ -133,14 +220,19 @@ def load_client_config(client_id: str, force_reload: bool = False) -> ClientConf
             return _config_cache[cache_key]
     
     try:
+        # Record mtime before parsing so a concurrent edit triggers a reload
+        mtime = _get_file_mtime(config_file)
+        
         # Load YAML data
         config_data = _load_yaml_file(config_file)
         
         # Validate with pydantic
-        client_config = ClientConfig(**config_data)
+        client_config = ClientConfig.model_validate(config_data)
         
         # Cache the validated config
         _config_cache[cache_key] = client_config
+        if mtime is not None:
+            _file_timestamps[str(config_file)] = mtime
         logger.info(f"Loaded client config for {client_id}")
         
         return client_config
@@ -180,14 +272,19 @@ def load_routing_rules(client_id: str, force_reload: bool = False) -> RoutingRul
             return _config_cache[cache_key]
     
     try:
+        # Record mtime before parsing so a concurrent edit triggers a reload
+        mtime = _get_file_mtime(routing_file)
+        
         # Load YAML data
         routing_data = _load_yaml_file(routing_file)
         
         # Validate with pydantic
-        routing_rules = RoutingRules(**routing_data)
+        routing_rules = RoutingRules.model_validate(routing_data)
         
         # Cache the validated config
         _config_cache[cache_key] = routing_rules
+        if mtime is not None:
+            _file_timestamps[str(routing_file)] = mtime
         logger.info(f"Loaded routing rules for {client_id}")
         
         return routing_rules
@@ -202,10 +299,35 @@ def load_routing_rules(client_id: str, force_reload: bool = False) -> RoutingRul
         raise ClientLoadError(error_msg)
 
 
+def preload_client_configs() -> int:
+    """
+    Load and cache configuration and routing rules for every available client.
+    
+    Intended to run once at application startup so that request handlers
+    only pay for an mtime check instead of YAML parsing and validation.
+    
+    Returns:
+        Number of clients successfully preloaded
+    """
+    loaded = 0
+    for client_id in get_available_clients():
+        try:
+            load_client_config(client_id)
+            load_routing_rules(client_id)
+            loaded += 1
+        except ClientLoadError as e:
+            logger.error(f"Failed to preload client {client_id}: {e}")
+    
+    logger.info(f"Preloaded configuration for {loaded} clients")
+    return loaded
+
+
 def load_ai_prompt(client_id: str, prompt_type: str) -> str:
     """
     Load AI prompt template for a client.
     
+    The file is cached in memory and only re-read when its mtime changes.
+    
     Args:
         client_id: Client identifier
         prompt_type: Type of prompt ('classification', 'acknowledgment', 'team-analysis')
@@ -219,13 +341,25 @@ def load_ai_prompt(client_id: str, prompt_type: str) -> str:
     client_path = CLIENTS_BASE_PATH / client_id
     prompt_file = client_path / "ai-context" / f"{prompt_type}-prompt.md"
     
+    # Check cache first
+    cache_key = f"{client_id}_prompt_{prompt_type}"
+    if cache_key in _config_cache:
+        if not _check_file_modified(prompt_file):
+            return _config_cache[cache_key]
+    
     try:
         if not prompt_file.exists():
             raise ClientLoadError(f"AI prompt file not found: {prompt_file}")
         
+        # Record mtime before reading so a concurrent edit triggers a reload
+        mtime = _get_file_mtime(prompt_file)
+        
         with open(prompt_file, 'r', encoding='utf-8') as f:
             content = f.read()
         
+        _config_cache[cache_key] = content
+        if mtime is not None:
+            _file_timestamps[str(prompt_file)] = mtime
         logger.debug(f"Loaded AI prompt {prompt_type} for {client_id}")
         return content
         
@@ -239,6 +373,8 @@ def load_fallback_responses(client_id: str) -> Dict:
     """
     Load fallback responses configuration.
     
+    The parsed file is cached in memory and only re-parsed when its mtime changes.
+    
     Args:
         client_id: Client identifier
         
@@ -251,8 +387,21 @@ def load_fallback_responses(client_id: str) -> Dict:
     client_path = CLIENTS_BASE_PATH / client_id
     fallback_file = client_path / "ai-context" / "fallback-responses.yaml"
     
+    # Check cache first
+    cache_key = f"{client_id}_fallback"
+    if cache_key in _config_cache:
+        if not _check_file_modified(fallback_file):
+            return _config_cache[cache_key]
+    
     try:
+        # Record mtime before parsing so a concurrent edit triggers a reload
+        mtime = _get_file_mtime(fallback_file)
+        
         fallback_data = _load_yaml_file(fallback_file)
+        
+        _config_cache[cache_key] = fallback_data
+        if mtime is not None:
+            _file_timestamps[str(fallback_file)] = mtime
         logger.debug(f"Loaded fallback responses for {client_id}")
         return fallback_data
         
@@ -270,7 +419,7 @@ def clear_cache(client_id: Optional[str] = None):
         client_id: If provided, clear cache only for this client.
                   If None, clear entire cache.
     """
-    global _config_cache, _file_timestamps
+    global _config_cache, _file_timestamps, _clients_listing
     
     if client_id:
         # Clear cache for specific client
@@ -282,4 +431,5 @@ def clear_cache(client_id: Optional[str] = None):
         # Clear entire cache
         _config_cache.clear()
         _file_timestamps.clear()
+        _clients_listing = None
         logger.info("Cleared entire configuration cache") 
\ No newline at end of file
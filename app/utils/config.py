@@ -5,6 +5,7 @@ Clean configuration management with environment variables.
 
 import os
 from dataclasses import dataclass
+from functools import lru_cache
 from typing import Optional
 
 @dataclass
@@ -18,6 +19,8 @@ class Config:
     # Mailgun (Required)
     mailgun_api_key: str
     mailgun_domain: str
+    mailgun_max_concurrency: int = 8
+    mailgun_max_sends_per_second: float = 0.0
     
     # Google Cloud (Optional for production)
     google_project_id: Optional[str] = None
@@ -27,11 +30,43 @@ class Config:
     environment: str = "production"
     port: int = 8080
     log_level: str = "INFO"
+    
+    # Classification batching and caching
+    classifier_batch_window_ms: int = 0
+    classifier_batch_max_size: int = 16
+    classifier_max_concurrency: int = 8
+    classifier_cache_size: int = 4096
+    classifier_semantic_cache: bool = False
+    classifier_semantic_threshold: float = 0.92
+    
+    # Anthropic request concurrency and connection keep-alive
+    anthropic_max_concurrency: int = 20
+    anthropic_keepalive_interval: float = 0.0
+    
+    # Anthropic Message Batches for non-interactive calls
+    anthropic_message_batches: bool = False
+    anthropic_batch_window_ms: int = 100
+    anthropic_batch_max_size: int = 32
+    anthropic_batch_max_wait: float = 900.0
+    
+    # Response composition
+    composer_single_call: bool = False
+    
+    # Task queue (optional; pipeline runs in-process when unset)
+    redis_url: Optional[str] = None
+    pipeline_max_concurrency: int = 8
 
+@lru_cache(maxsize=1)
 def get_config() -> Config:
     """
     Load configuration from environment variables.
     
+    The result is cached for the lifetime of the process; call
+    ``get_config.cache_clear()`` to pick up changed environment variables.
+    A cached call costs about as much as a dict lookup, so hot paths read
+    fields through get_config() rather than copying them into module
+    globals, which would keep stale values after a reload.
+    
     Required environment variables:
     - ANTHROPIC_API_KEY: Your Anthropic API key
     - MAILGUN_API_KEY: Your Mailgun API key  
@@ -44,6 +79,23 @@ def get_config() -> Config:
     - ENVIRONMENT: Application environment (default: production)
     - PORT: Server port (default: 8080)
     - LOG_LEVEL: Logging level (default: INFO)
+    - CLASSIFIER_BATCH_WINDOW_MS: Window for coalescing one client's classifications, 0 disables (default: 0)
+    - CLASSIFIER_BATCH_MAX_SIZE: Maximum emails per batched classification (default: 16)
+    - CLASSIFIER_MAX_CONCURRENCY: Maximum classification calls in flight, 0 for unbounded (default: 8)
+    - CLASSIFIER_CACHE_SIZE: Cached classifications for repeated emails, 0 disables (default: 4096)
+    - CLASSIFIER_SEMANTIC_CACHE: Reuse classifications of near-duplicate emails, needs fastembed (default: false)
+    - CLASSIFIER_SEMANTIC_THRESHOLD: Cosine similarity for a near-duplicate match (default: 0.92)
+    - ANTHROPIC_MAX_CONCURRENCY: Maximum Anthropic requests in flight, 0 for unbounded (default: 20)
+    - ANTHROPIC_KEEPALIVE_INTERVAL: Seconds between requests keeping idle connections open, 0 disables (default: 0)
+    - ANTHROPIC_MESSAGE_BATCHES: Send non-interactive Claude calls (team analysis, classification) as Message Batches (default: false)
+    - ANTHROPIC_BATCH_WINDOW_MS: Window for collecting a message batch (default: 100)
+    - ANTHROPIC_BATCH_MAX_SIZE: Maximum requests per message batch (default: 32)
+    - ANTHROPIC_BATCH_MAX_WAIT: Seconds before an unfinished batch is canceled and sent directly (default: 900)
+    - COMPOSER_SINGLE_CALL: Generate acknowledgment and team analysis in one Claude call (default: false)
+    - REDIS_URL: Enqueue email processing to arq workers, needs arq (optional)
+    - PIPELINE_MAX_CONCURRENCY: Emails classified, acknowledged and sent at once in-process, 0 for unbounded (default: 8)
+    - MAILGUN_MAX_CONCURRENCY: Maximum Mailgun sends in flight, 0 for unbounded (default: 8)
+    - MAILGUN_MAX_SENDS_PER_SECOND: Mailgun send rate limit per process, 0 for unlimited (default: 0)
     """
     
     # Validate required environment variables
@@ -65,5 +117,22 @@ def get_config() -> Config:
         google_region=os.environ.get("GOOGLE_CLOUD_REGION", "us-central1"),
         environment=os.environ.get("ENVIRONMENT", "production"),
         port=int(os.environ.get("PORT", 8080)),
-        log_level=os.environ.get("LOG_LEVEL", "INFO")
+        log_level=os.environ.get("LOG_LEVEL", "INFO"),
+        classifier_batch_window_ms=int(os.environ.get("CLASSIFIER_BATCH_WINDOW_MS", 0)),
+        classifier_batch_max_size=int(os.environ.get("CLASSIFIER_BATCH_MAX_SIZE", 16)),
+        classifier_max_concurrency=int(os.environ.get("CLASSIFIER_MAX_CONCURRENCY", 8)),
+        classifier_cache_size=int(os.environ.get("CLASSIFIER_CACHE_SIZE", 4096)),
+        classifier_semantic_cache=os.environ.get("CLASSIFIER_SEMANTIC_CACHE", "false").lower() == "true",
+        classifier_semantic_threshold=float(os.environ.get("CLASSIFIER_SEMANTIC_THRESHOLD", 0.92)),
+        anthropic_max_concurrency=int(os.environ.get("ANTHROPIC_MAX_CONCURRENCY", 20)),
+        anthropic_keepalive_interval=float(os.environ.get("ANTHROPIC_KEEPALIVE_INTERVAL", 0)),
+        anthropic_message_batches=os.environ.get("ANTHROPIC_MESSAGE_BATCHES", "false").lower() == "true",
+        anthropic_batch_window_ms=int(os.environ.get("ANTHROPIC_BATCH_WINDOW_MS", 100)),
+        anthropic_batch_max_size=int(os.environ.get("ANTHROPIC_BATCH_MAX_SIZE", 32)),
+        anthropic_batch_max_wait=float(os.environ.get("ANTHROPIC_BATCH_MAX_WAIT", 900)),
+        composer_single_call=os.environ.get("COMPOSER_SINGLE_CALL", "false").lower() == "true",
+        redis_url=os.environ.get("REDIS_URL") or None,
+        pipeline_max_concurrency=int(os.environ.get("PIPELINE_MAX_CONCURRENCY", 8)),
+        mailgun_max_concurrency=int(os.environ.get("MAILGUN_MAX_CONCURRENCY", 8)),
+        mailgun_max_sends_per_second=float(os.environ.get("MAILGUN_MAX_SENDS_PER_SECOND", 0))
     ) 
\ No newline at end of file
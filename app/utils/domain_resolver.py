@@ -10,6 +10,11 @@ from urllib.parse import urlparse
 
 logger = logging.getLogger(__name__)
 
+# Precompiled pattern for domain validation
+_DOMAIN_RE = re.compile(
+    r'^[a-z0-9]([a-z0-9-]{0,61}[a-z0-9])?(\.[a-z0-9]([a-z0-9-]{0,61}[a-z0-9])?)*$'
+)
+
 
 def extract_domain_from_email(email: str) -> Optional[str]:
     """
@@ -189,12 +194,7 @@ def is_valid_domain_format(domain: str) -> bool:
     if not domain:
         return False
     
-    # Enhanced domain pattern supporting unicode domains
-    domain_pattern = re.compile(
-        r'^[a-z0-9]([a-z0-9-]{0,61}[a-z0-9])?(\.[a-z0-9]([a-z0-9-]{0,61}[a-z0-9])?)*$'
-    )
-    
-    return bool(domain_pattern.match(domain))
+    return bool(_DOMAIN_RE.match(domain))
 
 
 def get_parent_domain(domain: str) -> Optional[str]:
@@ -414,8 +414,8 @@ def calculate_domain_similarity(domain1: str, domain2: str) -> float:
     if domain1 == domain2:
         return 1.0
     
-    # Check if one is subdomain of other
-    if is_subdomain_of(domain1, domain2) or is_subdomain_of(domain2, domain1):
+    # Check if one is subdomain of other (both are already normalized)
+    if domain1.endswith('.' + domain2) or domain2.endswith('.' + domain1):
         return 0.8
     
     # Check common parent domain
@@ -424,11 +424,10 @@ def calculate_domain_similarity(domain1: str, domain2: str) -> float:
     
     # Compare from right to left (TLD first)
     common_parts = 0
-    for i in range(1, min(len(parts1), len(parts2)) + 1):
-        if parts1[-i] == parts2[-i]:
-            common_parts += 1
-        else:
+    for label1, label2 in zip(reversed(parts1), reversed(parts2)):
+        if label1 != label2:
             break
+        common_parts += 1
     
     # If only TLD matches (like .com), consider it no similarity
     if common_parts <= 1:
@@ -544,7 +543,9 @@ class DomainMatcher:
             candidates: List of candidate domains
             
         Returns:
-            Tuple of (best_match, confidence, method)
+            Tuple of (best_match, confidence, method). When nothing clears the
+            similarity threshold, method is "no_match" and best_match is the
+            most similar candidate (if any) with its similarity score.
         """
         domain = normalize_domain(domain)
         if not domain:
@@ -580,4 +581,5 @@ class DomainMatcher:
         if best_match and similarity >= self.similarity_threshold:
             return best_match, similarity, "similarity_match"
         
-        return None, 0.0, "no_match" 
\ No newline at end of file
+        # Report the closest candidate anyway so callers can apply a looser cutoff
+        return best_match, similarity, "no_match" 
\ No newline at end of file
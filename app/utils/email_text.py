@@ -0,0 +1,40 @@
+"""
+Email body preprocessing for AI prompts.
+✂️ Keeps quoted threads and whitespace padding out of the prompt.
+"""
+
+import re
+from typing import Any, Dict
+
+# Body characters sent to Claude (about 1000 tokens); prompt processing time grows with length
+PROMPT_BODY_MAX_CHARS = 4000
+
+# Quoted reply lines and the "On <date>, <sender> wrote:" line introducing them
+_QUOTED_LINE_RE = re.compile(r'^(?:On .+ wrote:|>.*)$\n?', re.M)
+_SPACE_RUN_RE = re.compile(r'[ \t\r\f\v]+')
+_BLANK_LINES_RE = re.compile(r'\n(?: ?\n)+')
+
+
+def trim_body(text: str, max_chars: int = PROMPT_BODY_MAX_CHARS) -> str:
+    """
+    Shorten an email body for use in a prompt.
+    
+    Strips quoted reply lines, collapses runs of spaces and blank lines, and
+    keeps the first max_chars characters. Only a bounded head of the text is
+    scanned, so huge forwarded threads cost no more than moderately long ones.
+    
+    Args:
+        text: Email body
+        max_chars: Maximum length of the result
+    
+    Returns:
+        Trimmed body text
+    """
+    text = _QUOTED_LINE_RE.sub('', text[:max_chars * 4])
+    text = _BLANK_LINES_RE.sub('\n\n', _SPACE_RUN_RE.sub(' ', text))
+    return text.strip()[:max_chars]
+
+
+def prompt_body(email_data: Dict[str, Any]) -> str:
+    """Trimmed body of an inbound email, preferring Mailgun's stripped text."""
+    return trim_body(email_data.get('stripped_text') or email_data.get('body_text') or '')
@@ -0,0 +1,111 @@
+"""
+Selective multipart form parsing for webhooks.
+📨 Streams a multipart body and keeps only the text fields a handler reads.
+"""
+
+from typing import Dict, FrozenSet, Optional
+
+import multipart
+from multipart.multipart import parse_options_header
+from fastapi import Request
+
+
+class FormParseError(Exception):
+    """Raised when a multipart body cannot be parsed."""
+    pass
+
+
+class _SelectiveCollector:
+    """Multipart parser callbacks that buffer only wanted text fields."""
+    
+    def __init__(self, fields: FrozenSet[str], charset: str):
+        self.fields = fields
+        self.charset = charset
+        self.values: Dict[str, str] = {}
+        
+        self._header_name = b""
+        self._header_value = b""
+        self._disposition = b""
+        self._field_name: Optional[str] = None
+        self._data = bytearray()
+    
+    def on_part_begin(self):
+        self._disposition = b""
+        self._field_name = None
+        self._data = bytearray()
+    
+    def on_header_field(self, data: bytes, start: int, end: int):
+        self._header_name += data[start:end]
+    
+    def on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+    
+    def on_header_end(self):
+        if self._header_name.lower() == b"content-disposition":
+            self._disposition = self._header_value
+        self._header_name = b""
+        self._header_value = b""
+    
+    def on_headers_finished(self):
+        _, options = parse_options_header(self._disposition)
+        name = options.get(b"name", b"").decode(self.charset, errors="replace")
+        
+        # Attachments and unread fields are skipped without buffering
+        if name in self.fields and b"filename" not in options:
+            self._field_name = name
+    
+    def on_part_data(self, data: bytes, start: int, end: int):
+        if self._field_name is not None:
+            self._data += data[start:end]
+    
+    def on_part_end(self):
+        if self._field_name is not None:
+            self.values[self._field_name] = self._data.decode(self.charset, errors="replace")
+    
+    def callbacks(self) -> dict:
+        """Callback mapping for multipart.MultipartParser."""
+        return {
+            "on_part_begin": self.on_part_begin,
+            "on_part_data": self.on_part_data,
+            "on_part_end": self.on_part_end,
+            "on_header_field": self.on_header_field,
+            "on_header_value": self.on_header_value,
+            "on_header_end": self.on_header_end,
+            "on_headers_finished": self.on_headers_finished,
+        }
+
+
+async def parse_multipart_fields(request: Request, fields: FrozenSet[str]) -> Dict[str, str]:
+    """
+    Stream a multipart/form-data body and return only the requested text fields.
+    
+    Unlike request.form(), file parts (attachments) and unrequested fields are
+    never buffered or spooled to disk.
+    
+    Args:
+        request: Incoming request with a multipart body
+        fields: Names of the text fields to keep
+        
+    Returns:
+        Mapping of requested field names to values (missing fields are omitted)
+        
+    Raises:
+        FormParseError: If the body has no multipart boundary
+    """
+    _, params = parse_options_header(request.headers.get("content-type", ""))
+    boundary = params.get(b"boundary")
+    if not boundary:
+        raise FormParseError("Missing boundary in multipart body")
+    
+    charset = params.get(b"charset", b"utf-8")
+    if isinstance(charset, bytes):
+        charset = charset.decode("latin-1")
+    
+    collector = _SelectiveCollector(fields, charset)
+    parser = multipart.MultipartParser(boundary, collector.callbacks())
+    
+    async for chunk in request.stream():
+        parser.write(chunk)
+    parser.finalize()
+    
+    return collector.values
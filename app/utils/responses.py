@@ -0,0 +1,28 @@
+"""
+Response helpers for JSON endpoints.
+⚡ Serializes large payloads off the event loop.
+"""
+
+import asyncio
+from typing import Any
+
+import orjson
+from fastapi import Response
+
+
+async def orjson_response(payload: Any, status_code: int = 200) -> Response:
+    """
+    Serialize a payload with orjson in a worker thread.
+    
+    Use for large responses so serialization does not block concurrent
+    webhook requests on the event loop.
+    
+    Args:
+        payload: JSON-serializable data
+        status_code: HTTP status code
+        
+    Returns:
+        Response with the serialized JSON body
+    """
+    body = await asyncio.to_thread(orjson.dumps, payload)
+    return Response(body, status_code=status_code, media_type="application/json")
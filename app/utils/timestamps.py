@@ -0,0 +1,28 @@
+"""
+Timestamp helpers for hot paths.
+⏱️ Reuses the formatted UTC timestamp within the same second.
+"""
+
+import time
+
+_last_iso_ts_second: int = -1
+_last_iso_ts_str: str = ""
+
+
+def utc_timestamp() -> str:
+    """
+    Current UTC time as an ISO 8601 string with one-second granularity.
+    
+    The formatted string is cached and only rebuilt when the second changes,
+    so repeated calls avoid allocating and formatting a datetime each time.
+    
+    Returns:
+        Timestamp such as ``2024-01-31T12:00:00``
+    """
+    global _last_iso_ts_second, _last_iso_ts_str
+    
+    second = int(time.time())
+    if second != _last_iso_ts_second:
+        _last_iso_ts_str = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(second))
+        _last_iso_ts_second = second
+    return _last_iso_ts_str
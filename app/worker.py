@@ -0,0 +1,55 @@
+"""
+arq worker for the email processing pipeline.
+⚙️ Run with: arq app.worker.WorkerSettings
+"""
+
+import logging
+import os
+from typing import Any, Dict, Optional
+
+from arq.connections import RedisSettings
+
+from .routers.webhooks import process_email_pipeline
+from .services.client_manager import get_client_manager
+from .services.dynamic_classifier import DynamicClassifier
+from .services.routing_engine import RoutingEngine
+from .services.email_sender import close_http_client
+from .services.anthropic_client import close_anthropic_client
+from .services.warmup import warm_caches
+
+logging.basicConfig(
+    level=os.environ.get("LOG_LEVEL", "INFO").upper(),
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+
+
+async def process_email(ctx: Dict[str, Any], email_data: Dict[str, Any], client_id: Optional[str]):
+    """Run the full pipeline for one enqueued email (job name: task_queue.PROCESS_EMAIL_JOB)."""
+    client_manager = get_client_manager()
+    await process_email_pipeline(
+        email_data,
+        client_id,
+        DynamicClassifier(client_manager),
+        client_manager,
+        RoutingEngine(client_manager)
+    )
+
+
+async def startup(ctx: Dict[str, Any]):
+    """Warm client configuration caches and Anthropic connections before taking jobs."""
+    await warm_caches()
+
+
+async def shutdown(ctx: Dict[str, Any]):
+    """Close pooled HTTP clients."""
+    await close_http_client()
+    await close_anthropic_client()
+
+
+class WorkerSettings:
+    """arq worker configuration."""
+    functions = [process_email]
+    on_startup = startup
+    on_shutdown = shutdown
+    redis_settings = RedisSettings.from_dsn(os.environ.get("REDIS_URL", "redis://localhost:6379"))
+    max_jobs = int(os.environ.get("WORKER_MAX_JOBS", 20))
@@ -0,0 +1,90 @@
+"""
+Shared test fixtures.
+🧪 Mock Anthropic and Mailgun HTTP APIs and run async tests on asyncio.
+"""
+
+import os
+from contextlib import ExitStack
+from unittest.mock import patch
+
+import httpx
+import orjson
+import pytest
+
+# Required settings, set before any app module reads the configuration
+os.environ.setdefault("ANTHROPIC_API_KEY", "test-key")
+os.environ.setdefault("MAILGUN_API_KEY", "test-key")
+os.environ.setdefault("MAILGUN_DOMAIN", "test.domain.com")
+
+from app.services import anthropic_client, email_sender
+from app.services.client_manager import EnhancedClientManager
+
+ANTHROPIC_API_URL = "https://api.anthropic.com"
+
+# Client configuration shipped under clients/active
+TEST_CLIENT_ID = "client-001-cole-nielson"
+
+
+@pytest.fixture
+def anyio_backend():
+    """Run @pytest.mark.anyio tests on asyncio, which the app's per-loop limits are built for."""
+    return "asyncio"
+
+
+@pytest.fixture
+def mock_http_client():
+    """Build an httpx.AsyncClient whose requests are answered by a handler: mock_http_client(handler)."""
+    def build(handler, base_url=ANTHROPIC_API_URL):
+        return httpx.AsyncClient(base_url=base_url, transport=httpx.MockTransport(handler))
+    return build
+
+
+@pytest.fixture
+def anthropic_api(mock_http_client):
+    """Answer requests on the shared Anthropic client with a handler: anthropic_api(handler)."""
+    with ExitStack() as stack:
+        def route(handler):
+            stack.enter_context(patch.object(anthropic_client, "_client", mock_http_client(handler)))
+        yield route
+
+
+@pytest.fixture
+def mailgun_api(mock_http_client):
+    """Answer requests on the shared Mailgun client with a handler: mailgun_api(handler)."""
+    with ExitStack() as stack:
+        def route(handler):
+            client = mock_http_client(handler, base_url=email_sender.MAILGUN_API_URL)
+            stack.enter_context(patch.object(email_sender, "_client", client))
+        yield route
+
+
+@pytest.fixture
+def message_response():
+    """Build a Messages API response carrying the given text: message_response("ok")."""
+    def build(text):
+        return httpx.Response(200, json={"content": [{"type": "text", "text": text}]})
+    return build
+
+
+@pytest.fixture
+def sse_response():
+    """
+    Build a streamed Messages API response: sse_response("Hello", " there").
+    
+    The stream ends with message_stop, or with an error event when error is given.
+    """
+    def build(*texts, error=None):
+        events = [{"type": "message_start", "message": {}}, {"type": "ping"}]
+        events += [{"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": text}}
+                   for text in texts]
+        events.append({"type": "error", "error": error} if error else {"type": "message_stop"})
+        body = b"".join(b"event: %s\ndata: %s\n\n" % (event["type"].encode(), orjson.dumps(event))
+                        for event in events)
+        return httpx.Response(200, content=body, headers={"content-type": "text/event-stream"})
+    return build
+
+
+@pytest.fixture
+def client_manager():
+    """Client manager over the client configurations in the repository."""
+    return EnhancedClientManager()
@@ -0,0 +1,101 @@
+"""
+Message Batches tests.
+🧪 Batch submission, per-request results, length buckets and the polling deadline.
+"""
+
+import asyncio
+import json
+from unittest.mock import AsyncMock, patch
+
+import httpx
+import pytest
+
+from app.services import anthropic_batcher
+from app.services.anthropic_batcher import MessageBatcher, MessageBatchError
+
+
+def _batch_api(created, results):
+    """
+    Handler for a Message Batches API whose batches end on the first poll.
+    
+    Args:
+        created: List collecting the requests of each created batch
+        results: Result lines returned for every batch
+    """
+    def handler(request):
+        if request.method == 'POST':
+            created.append(json.loads(request.content)['requests'])
+            return httpx.Response(200, json={'id': f'batch_{len(created)}'})
+        if request.url.path.endswith('/results'):
+            return httpx.Response(200, content='\n'.join(json.dumps(line) for line in results))
+        return httpx.Response(200, json={
+            'processing_status': 'ended',
+            'results_url': f'https://api.anthropic.com{request.url.path}/results'
+        })
+    return handler
+
+
+def _succeeded(custom_id, text):
+    """Result line for a request that succeeded with the given text."""
+    return {'custom_id': custom_id, 'result': {'type': 'succeeded', 'message': {'content': [{'text': text}]}}}
+
+
+@pytest.mark.anyio
+async def test_message_batcher_resolves_results_by_request(mock_http_client):
+    """Test that concurrent requests share one message batch and get their own results"""
+    created = []
+    results = [_succeeded('req-0', 'first'),
+               {'custom_id': 'req-1', 'result': {'type': 'errored', 'error': {'type': 'overloaded'}}}]
+    batcher = MessageBatcher(window_ms=10, poll_interval=0, client=mock_http_client(_batch_api(created, results)))
+    
+    first, second = await asyncio.gather(
+        batcher.submit({'model': 'm', 'service_tier': 'auto', 'messages': []}),
+        batcher.submit({'model': 'm', 'messages': []}),
+        return_exceptions=True
+    )
+    
+    assert first == 'first'
+    assert isinstance(second, MessageBatchError)
+    assert len(created) == 1
+    assert [r['custom_id'] for r in created[0]] == ['req-0', 'req-1']
+    assert 'service_tier' not in created[0][0]['params']
+
+
+@pytest.mark.anyio
+async def test_message_batcher_splits_batches_by_prompt_length(mock_http_client):
+    """Test that short and long prompts are submitted as separate message batches"""
+    created = []
+    batcher = MessageBatcher(window_ms=10, poll_interval=0,
+                             client=mock_http_client(_batch_api(created, [_succeeded('req-0', 'ok')])))
+    
+    results = await asyncio.gather(
+        batcher.submit({'model': 'm', 'messages': [{'role': 'user', 'content': 'short'}]}),
+        batcher.submit({'model': 'm', 'messages': [{'role': 'user', 'content': 'x' * 20000}]})
+    )
+    
+    assert results == ['ok', 'ok']
+    assert len(created) == 2
+    assert all(len(requests) == 1 for requests in created)
+
+
+@pytest.mark.anyio
+async def test_message_batcher_falls_back_to_direct_calls_at_deadline(mock_http_client):
+    """Test that polling survives transient errors and an overdue batch is canceled and sent directly"""
+    requests = []
+    
+    def handler(request):
+        requests.append((request.method, request.url.path))
+        if request.method == 'POST':
+            return httpx.Response(200, json={'id': 'batch_1'})
+        if len(requests) == 2:
+            return httpx.Response(503)
+        return httpx.Response(200, json={'processing_status': 'in_progress'})
+    
+    batcher = MessageBatcher(window_ms=0, poll_interval=0.01, max_poll_interval=0.01,
+                             max_wait=0.1, client=mock_http_client(handler))
+    with patch.object(anthropic_batcher, 'create_message', AsyncMock(return_value='direct')) as direct:
+        assert await batcher.submit({'model': 'm', 'messages': []}) == 'direct'
+    
+    direct.assert_awaited_once()
+    assert requests[-1] == ('POST', '/v1/messages/batches/batch_1/cancel')
+    assert sum(method == 'GET' for method, _ in requests) >= 2
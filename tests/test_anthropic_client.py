@@ -0,0 +1,141 @@
+"""
+Anthropic client tests.
+🧪 Request sharing, response caching, streaming, retries and rate limits.
+"""
+
+import asyncio
+import time
+from datetime import datetime, timezone
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import httpx
+import pytest
+
+from app.services import anthropic_client
+from app.services.anthropic_client import RateLimitBucket
+
+
+@pytest.mark.anyio
+async def test_stream_message_yields_text_deltas(anthropic_api, sse_response):
+    """Test that streamed Messages API events are decoded into text fragments"""
+    requests_seen = []
+    
+    def handler(request):
+        assert b'"stream":true' in request.content.replace(b' ', b'')
+        requests_seen.append(request)
+        # The first attempt is rate limited and retried before any output
+        if len(requests_seen) == 1:
+            return httpx.Response(429, headers={'retry-after': '0'})
+        return sse_response('Hello', ' there')
+    
+    anthropic_api(handler)
+    # A single concurrency slot shows the stream gives it back, including after the retry
+    semaphore = asyncio.Semaphore(1)
+    with patch.object(anthropic_client, '_get_semaphore', return_value=semaphore):
+        chunks = [chunk async for chunk in anthropic_client.stream_message({'model': 'm', 'messages': []})]
+    
+    assert chunks == ['Hello', ' there']
+    assert not semaphore.locked()
+    assert len(requests_seen) == 2
+
+
+@pytest.mark.anyio
+async def test_create_message_shares_identical_inflight_requests(anthropic_api, message_response):
+    """Test that concurrent identical requests are sent once"""
+    requests_seen = []
+    
+    async def handler(request):
+        requests_seen.append(request)
+        await asyncio.sleep(0.01)
+        return message_response('ok')
+    
+    anthropic_api(handler)
+    payload = {'model': 'm', 'messages': [{'role': 'user', 'content': 'hi'}]}
+    results = await asyncio.gather(*(anthropic_client.create_message(dict(payload)) for _ in range(3)))
+    
+    assert results == ['ok', 'ok', 'ok']
+    assert len(requests_seen) == 1
+    assert not anthropic_client._inflight
+
+
+@pytest.mark.anyio
+async def test_create_message_caches_low_temperature_responses(anthropic_api, message_response):
+    """Test that repeated low-temperature requests are answered from the response cache"""
+    requests_seen = []
+    
+    def handler(request):
+        requests_seen.append(request)
+        return message_response('ok')
+    
+    async def send_twice(temperature):
+        payload = {'model': 'm', 'temperature': temperature, 'messages': [{'role': 'user', 'content': 'cache me'}]}
+        return [await anthropic_client.create_message(dict(payload)) for _ in range(2)]
+    
+    anthropic_api(handler)
+    with patch.object(anthropic_client, '_response_cache', type(anthropic_client._response_cache)()):
+        assert await send_twice(0.0) == ['ok', 'ok']
+        assert len(requests_seen) == 1
+        # Composer calls run at 0.3 and must produce a fresh reply each time
+        assert await send_twice(0.3) == ['ok', 'ok']
+        assert len(requests_seen) == 3
+
+
+@pytest.mark.anyio
+async def test_connection_keepalive_survives_unexpected_errors():
+    """Test that the keep-alive loop logs any failure and keeps running until cancelled"""
+    client = MagicMock()
+    client.head = AsyncMock(side_effect=[RuntimeError('boom'), ValueError('bad'), None, None, None])
+    
+    with patch.object(anthropic_client, 'get_anthropic_client', return_value=client):
+        task = asyncio.ensure_future(anthropic_client._keep_connection_warm(0))
+        while client.head.await_count < 3:
+            await asyncio.sleep(0)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+    
+    assert task.cancelled()
+    assert client.head.await_count >= 3
+
+
+@pytest.mark.anyio
+async def test_rate_limit_bucket_waits_for_reset():
+    """Test that a spent rate limit budget delays requests until the window resets"""
+    bucket = RateLimitBucket()
+    reset = datetime.fromtimestamp(time.time() + 0.2, tz=timezone.utc).isoformat()
+    bucket.update_from_headers({
+        'anthropic-ratelimit-requests-remaining': '1',
+        'anthropic-ratelimit-requests-reset': reset,
+        'anthropic-ratelimit-input-tokens-remaining': '10000',
+        'anthropic-ratelimit-input-tokens-reset': reset,
+    })
+    
+    started = time.monotonic()
+    await bucket.acquire(100)
+    first = time.monotonic() - started
+    await bucket.acquire(100)
+    second = time.monotonic() - started
+    
+    assert first < 0.1
+    assert second >= 0.15
+    assert bucket.tokens_remaining == 9800
+
+
+@pytest.mark.anyio
+async def test_post_with_retry_retries_connect_timeouts_and_408(anthropic_api, message_response):
+    """Test that connect timeouts and 408 responses are retried before failing over"""
+    calls = []
+    
+    def handler(request):
+        calls.append(request)
+        if len(calls) == 1:
+            raise httpx.ConnectTimeout("connect timed out", request=request)
+        if len(calls) == 2:
+            return httpx.Response(408)
+        return message_response('ok')
+    
+    anthropic_api(handler)
+    with patch.object(anthropic_client, '_retry_delay', lambda attempt, response: 0):
+        response = await anthropic_client.post_with_retry('/v1/messages', b'{}')
+    
+    assert response.status_code == 200
+    assert len(calls) == 3
@@ -0,0 +1,86 @@
+"""
+Classification micro-batching tests.
+🧪 Coalescing, per-client isolation, individual fallback and the concurrency limit.
+"""
+
+import asyncio
+import json
+
+import pytest
+
+from app.services.classification_batcher import ClassificationBatcher
+
+
+def _validate(result):
+    result.setdefault('confidence', 0.5)
+    return result
+
+
+@pytest.fixture
+def calls():
+    """Log of ('one' | 'batch', prompt) AI calls made by the batcher under test."""
+    return []
+
+
+@pytest.fixture
+def classify_one(calls):
+    async def classify(prompt, service_tier):
+        calls.append(('one', prompt))
+        return {'category': prompt, 'confidence': 0.5}
+    return classify
+
+
+@pytest.mark.anyio
+async def test_classification_batcher_coalesces_prompts(calls, classify_one):
+    """Test that concurrent classifications share one AI call"""
+    async def complete(prompt, max_tokens, service_tier):
+        calls.append(('batch', prompt))
+        return json.dumps([{'category': 'a'}, {'category': 'b'}])
+    
+    batcher = ClassificationBatcher(classify_one, complete, _validate, window_ms=10)
+    results = await asyncio.gather(batcher.classify('a'), batcher.classify('b'))
+    
+    assert [r['category'] for r in results] == ['a', 'b']
+    assert [kind for kind, _ in calls] == ['batch']
+    
+    # Prompts from different clients never share a call
+    calls.clear()
+    results = await asyncio.gather(batcher.classify('a', client_id='acme'), batcher.classify('b', client_id='globex'))
+    
+    assert [r['category'] for r in results] == ['a', 'b']
+    assert [kind for kind, _ in calls] == ['one', 'one']
+
+
+@pytest.mark.anyio
+async def test_classification_batcher_retries_malformed_batches_individually(calls, classify_one):
+    """Test that a malformed batch response retries each prompt on its own"""
+    async def bad_complete(prompt, max_tokens, service_tier):
+        calls.append(('batch', prompt))
+        return 'not json'
+    
+    batcher = ClassificationBatcher(classify_one, bad_complete, _validate, window_ms=10)
+    results = await asyncio.gather(batcher.classify('a'), batcher.classify('b'))
+    
+    assert [r['category'] for r in results] == ['a', 'b']
+    assert sorted(kind for kind, _ in calls) == ['batch', 'one', 'one']
+
+
+@pytest.mark.anyio
+async def test_classification_batcher_limits_unbatched_concurrency():
+    """Test that unbatched calls respect the concurrency limit"""
+    in_flight = []
+    
+    async def slow_classify_one(prompt, service_tier):
+        in_flight.append(prompt)
+        peak = len(in_flight)
+        await asyncio.sleep(0.01)
+        in_flight.remove(prompt)
+        return {'category': prompt, 'peak': peak}
+    
+    async def complete(prompt, max_tokens, service_tier):
+        raise AssertionError("batching is disabled")
+    
+    batcher = ClassificationBatcher(slow_classify_one, complete, _validate, window_ms=0, max_concurrency=2)
+    results = await asyncio.gather(*(batcher.classify(str(i)) for i in range(5)))
+    
+    assert max(r['peak'] for r in results) == 2
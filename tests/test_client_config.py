@@ -0,0 +1,23 @@
+"""
+Client configuration model tests.
+🧪 Field validators on client IDs and brand colors.
+"""
+
+import pytest
+from pydantic import ValidationError
+
+from app.models.client_config import BrandingConfig, ClientInfo
+
+
+def test_client_config_field_validators():
+    """Test client ID and hex color validation"""
+    assert ClientInfo(id='client-001_acme', name='Acme', industry='Retail').id == 'client-001_acme'
+    with pytest.raises(ValidationError, match='must start with'):
+        ClientInfo(id='acme', name='Acme', industry='Retail')
+    with pytest.raises(ValidationError, match='alphanumeric'):
+        ClientInfo(id='client-acme!', name='Acme', industry='Retail')
+    
+    assert BrandingConfig(company_name='Acme', email_signature='Team', primary_color='#A1b2C3').primary_color == '#A1b2C3'
+    for bad_color in ('667eea', '#667ee', '#66_7ee', '#+67eea', '#zzzzzz'):
+        with pytest.raises(ValidationError, match='hex color'):
+            BrandingConfig(company_name='Acme', email_signature='Team', primary_color=bad_color)
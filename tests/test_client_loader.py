@@ -0,0 +1,43 @@
+"""
+Client configuration loading tests.
+🧪 Parsed-config caching and the YAML-to-JSON file cache.
+"""
+
+import os
+from unittest.mock import patch
+
+from app.utils import client_loader
+
+from .conftest import TEST_CLIENT_ID
+
+
+def test_client_config_cache_skips_reparse():
+    """Test that a loaded client config is served from cache until its file changes"""
+    client_loader.preload_client_configs()
+    
+    with patch.object(client_loader, '_load_yaml_file', side_effect=AssertionError("re-parsed")):
+        config = client_loader.load_client_config(TEST_CLIENT_ID)
+        rules = client_loader.load_routing_rules(TEST_CLIENT_ID)
+    
+    assert config.client.id == TEST_CLIENT_ID
+    assert 'support' in rules.routing
+
+
+def test_yaml_json_cache(tmp_path):
+    """Test that parsed YAML is cached as JSON and invalidated when the YAML changes"""
+    yaml_file = tmp_path / "config.yaml"
+    yaml_file.write_text("name: first\n")
+    
+    assert client_loader._load_yaml_file(yaml_file) == {'name': 'first'}
+    json_file = tmp_path / "config.yaml.json"
+    assert json_file.exists()
+    
+    # Cache is preferred while it is at least as new as the YAML
+    json_file.write_bytes(b'{"name": "cached"}')
+    assert client_loader._load_yaml_file(yaml_file) == {'name': 'cached'}
+    
+    # Editing the YAML invalidates the cache
+    yaml_file.write_text("name: second\n")
+    stat = json_file.stat()
+    os.utime(yaml_file, (stat.st_atime, stat.st_mtime + 10))
+    assert client_loader._load_yaml_file(yaml_file) == {'name': 'second'}
@@ -0,0 +1,24 @@
+"""
+Source structure checks.
+🧪 Guards against accidental redefinitions in app modules.
+"""
+
+import ast
+from pathlib import Path
+
+
+def test_app_modules_do_not_redefine_functions():
+    """Test that no module defines the same function or class twice in one scope"""
+    duplicates = []
+    for path in Path(__file__).resolve().parent.parent.joinpath('app').rglob('*.py'):
+        for node in ast.walk(ast.parse(path.read_text())):
+            body = getattr(node, 'body', None)
+            if not isinstance(body, list):
+                continue
+            seen = set()
+            for child in body:
+                if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                    if child.name in seen:
+                        duplicates.append(f"{path.name}:{child.lineno} {child.name}")
+                    seen.add(child.name)
+    assert duplicates == []
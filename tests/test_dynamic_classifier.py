@@ -0,0 +1,58 @@
+"""
+Multi-tenant classifier tests.
+🧪 Trivial-email skipping and validation of AI classifications.
+"""
+
+from unittest.mock import patch
+
+import pytest
+
+from app.services.dynamic_classifier import (
+    DynamicClassifier, _trivial_reason, get_classification_stats
+)
+
+from .conftest import TEST_CLIENT_ID
+
+
+@pytest.mark.anyio
+async def test_trivial_emails_skip_ai_classification(client_manager):
+    """Test that short and automated emails are classified without an AI call"""
+    classifier = DynamicClassifier(client_manager)
+    
+    async def fail(*args, **kwargs):
+        raise AssertionError("AI service should not be called")
+    
+    with patch.object(classifier.batcher, 'classify', fail):
+        thanks = await classifier.classify_email({'subject': 'Re: ticket', 'stripped_text': 'Thanks!'}, TEST_CLIENT_ID)
+        away = await classifier.classify_email(
+            {'subject': 'Automatic reply: invoice', 'stripped_text': 'I am away until Monday with no access to email.'},
+            TEST_CLIENT_ID
+        )
+    
+    assert thanks['method'] == away['method'] == 'trivial_skip'
+    assert thanks['category'] == 'general'
+    # Trivial emails still get a keyword-derived category for routing
+    assert away['category'] == 'billing'
+    
+    stats = get_classification_stats()
+    assert stats['trivial_skips'] >= 2
+    assert 0.0 < stats['trivial_skip_rate'] <= 1.0
+
+
+def test_trivial_reason_only_flags_automated_subjects_and_short_mail():
+    """Test which emails count as not worth an AI call"""
+    # Subject words count, and customers asking to unsubscribe are not automated mail
+    assert _trivial_reason({'subject': 'Please refund my last invoice payment', 'stripped_text': 'See subject'}) is None
+    assert _trivial_reason({'subject': 'Help', 'stripped_text': 'Please unsubscribe me from the weekly digest list'}) is None
+    # Bounce and out-of-office markers only count in the subject
+    assert _trivial_reason({'subject': 'Lost order', 'stripped_text': 'My package was undeliverable, please resend it'}) is None
+    assert _trivial_reason({'subject': 'Undeliverable: Your order', 'stripped_text': 'The message could not be delivered to anyone'})
+
+
+def test_validate_classification_coerces_model_output():
+    """Test that AI classifications are type-checked before reaching templates"""
+    classification = DynamicClassifier._validate_classification({'category': 'billing', 'confidence': '0.8'})
+    assert classification['confidence'] == 0.8
+    
+    with pytest.raises(ValueError):
+        DynamicClassifier._validate_classification({'category': 'billing', 'confidence': 'very'})
@@ -0,0 +1,64 @@
+"""
+Response composition tests.
+🧪 Fallbacks of the streamed customer acknowledgment.
+"""
+
+from unittest.mock import patch
+
+import httpx
+import pytest
+
+from app.services import email_composer
+
+from .conftest import TEST_CLIENT_ID
+
+EMAIL = {'from': 'jane@example.com', 'to': 'support@acme.com', 'subject': 'Invoice', 'stripped_text': 'Charged twice'}
+CLASSIFICATION = {'category': 'billing', 'confidence': 0.9}
+
+
+async def _collect_acknowledgment():
+    """Stream an acknowledgment, recording its fragments and any exception that ends it."""
+    chunks = []
+    try:
+        async for chunk in email_composer.generate_customer_acknowledgment_stream(EMAIL, CLASSIFICATION, TEST_CLIENT_ID):
+            chunks.append(chunk)
+    except Exception as e:
+        chunks.append(e)
+    return chunks
+
+
+@pytest.mark.anyio
+async def test_acknowledgment_stream_falls_back_when_prompt_fails(anthropic_api):
+    """Test that a prompt composition failure yields the hard fallback without an API call"""
+    def handler(request):
+        raise AssertionError("no API call expected")
+    
+    anthropic_api(handler)
+    engine = email_composer._get_template_engine()
+    with patch.object(engine, 'compose_acknowledgment_prompt', side_effect=KeyError('template')):
+        chunks = await _collect_acknowledgment()
+    
+    assert chunks == [email_composer._get_hard_fallback_acknowledgment(CLASSIFICATION)]
+
+
+@pytest.mark.anyio
+async def test_acknowledgment_stream_falls_back_before_first_chunk(anthropic_api):
+    """Test that a stream failing before any text yields the client's fallback response"""
+    anthropic_api(lambda request: httpx.Response(400, json={'error': {'type': 'invalid_request_error'}}))
+    
+    chunks = await _collect_acknowledgment()
+    
+    engine = email_composer._get_template_engine()
+    assert chunks == [engine.get_fallback_response(TEST_CLIENT_ID, 'customer_acknowledgments', 'billing')]
+
+
+@pytest.mark.anyio
+async def test_acknowledgment_stream_reraises_after_partial_output(anthropic_api, sse_response):
+    """Test that a failure after partial output propagates, since the caller already has text"""
+    anthropic_api(lambda request: sse_response('Thanks', error={'type': 'overloaded_error'}))
+    
+    chunks = await _collect_acknowledgment()
+    
+    assert chunks[0] == 'Thanks'
+    assert isinstance(chunks[1], RuntimeError)
+    assert len(chunks) == 2
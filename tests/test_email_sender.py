@@ -0,0 +1,95 @@
+"""
+Mailgun sending tests.
+🧪 Multipart form posts, send rate limiting and team email HTML.
+"""
+
+import asyncio
+import dataclasses
+import time
+from unittest.mock import patch
+
+import httpx
+import pytest
+
+from app.services import email_sender
+from app.utils.config import get_config
+
+from .conftest import TEST_CLIENT_ID
+
+
+def _accepted():
+    """Mailgun's reply to an accepted message."""
+    return httpx.Response(200, json={'id': '<msg@mailgun>'})
+
+
+@pytest.mark.anyio
+async def test_mailgun_sends_are_spaced_by_rate_limit():
+    """Test that the send rate limit spaces out a burst of sends"""
+    with patch.object(email_sender, '_next_send_at', 0.0):
+        started = time.monotonic()
+        await asyncio.gather(*(email_sender._wait_for_send_slot(20) for _ in range(3)))
+    
+    assert time.monotonic() - started >= 0.09
+
+
+@pytest.mark.anyio
+async def test_mailgun_posts_stay_spaced_under_concurrency_limit(mailgun_api):
+    """Test that sends released together by the concurrency limit still post at the configured rate"""
+    posted = []
+    release_at = time.monotonic() + 0.2
+    
+    async def handler(request):
+        posted.append(time.monotonic())
+        # The first two sends finish together, freeing both concurrency slots at once
+        if len(posted) <= 2:
+            await asyncio.sleep(release_at - time.monotonic())
+        return _accepted()
+    
+    mailgun_api(handler)
+    config = dataclasses.replace(get_config(), mailgun_max_concurrency=2, mailgun_max_sends_per_second=20)
+    with patch.object(email_sender, 'get_config', return_value=config), \
+         patch.object(email_sender, '_next_send_at', 0.0):
+        await asyncio.gather(*(
+            email_sender._send_email('jane@example.com', 'Hi', 'text', '<p>text</p>') for _ in range(4)
+        ))
+    
+    gaps = [later - earlier for earlier, later in zip(posted, posted[1:])]
+    assert len(posted) == 4
+    assert min(gaps) >= 0.045
+
+
+@pytest.mark.anyio
+async def test_send_email_posts_multipart_form(mailgun_api):
+    """Test that Mailgun sends go out as multipart form fields without percent-encoding"""
+    seen = []
+    
+    def handler(request):
+        seen.append(request)
+        return _accepted()
+    
+    mailgun_api(handler)
+    result = await email_sender._send_email(
+        'jane@example.com', 'Re: Hi', 'text', '<p style="color: #fff">Hi & bye</p>',
+        headers={'X-Client-ID': 'acme'}
+    )
+    
+    assert result == {'id': '<msg@mailgun>'}
+    assert seen[0].headers['content-type'].startswith('multipart/form-data')
+    body = seen[0].read()
+    assert b'<p style="color: #fff">Hi & bye</p>' in body
+    assert b'name="h:X-Client-ID"\r\n\r\nacme' in body
+
+
+def test_client_team_template_escapes_ai_category(client_manager):
+    """Test that the model-chosen category is escaped in the client team HTML"""
+    email = {'from': 'jane@example.com', 'to': 'support@acme.com', 'subject': 'Hi',
+             'stripped_text': 'Hello', 'body_text': 'Hello'}
+    classification = {'category': '<img src=x onerror=alert(1)>', 'confidence': 0.8, 'reasoning': 'r'}
+    
+    _, html_body = email_sender.create_client_team_template(
+        TEST_CLIENT_ID, client_manager.get_client_config(TEST_CLIENT_ID), email,
+        classification, 'analysis', 'team@acme.com'
+    )
+    
+    assert '<img' not in html_body
+    assert '&lt;img src=x onerror=alert(1)&gt;' in html_body
@@ -0,0 +1,24 @@
+"""
+Email template tests.
+🧪 HTML escaping of email content and AI output.
+"""
+
+from app.utils.email_templates import create_team_template, html_text
+
+
+def test_html_text_escapes_and_keeps_line_breaks():
+    """Test that untrusted text is escaped for HTML bodies with CRLF and LF breaks kept"""
+    assert html_text("<script>x</script> & co\r\nline 2\nline 3") == \
+        "&lt;script&gt;x&lt;/script&gt; &amp; co<br>line 2<br>line 3"
+
+
+def test_team_template_escapes_ai_category():
+    """Test that the model-chosen category is escaped in the team HTML"""
+    email = {'from': 'jane@example.com', 'to': 'support@acme.com', 'subject': 'Hi',
+             'stripped_text': 'Hello', 'body_text': 'Hello'}
+    classification = {'category': '<img src=x onerror=alert(1)>', 'confidence': 0.8, 'reasoning': 'r'}
+    
+    _, html_body = create_team_template(email, classification, 'analysis')
+    
+    assert '<img' not in html_body
+    assert '&lt;img src=x onerror=alert(1)&gt;' in html_body
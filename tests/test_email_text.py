@@ -0,0 +1,13 @@
+"""
+Email body preprocessing tests.
+🧪 Trimming of bodies sent to Claude.
+"""
+
+from app.utils.email_text import trim_body
+
+
+def test_trim_body_strips_quoted_replies_and_truncates():
+    """Test that prompt bodies drop quoted threads, padding and excess length"""
+    body = "Hi there,\n\n\n\nPlease   help.\n\nOn Mon, Jan 1, 2024 at 10:00 AM Bob <b@x.com> wrote:\n> old\n> thread\n"
+    assert trim_body(body) == "Hi there,\n\nPlease help."
+    assert len(trim_body("x" * 100000)) == 4000
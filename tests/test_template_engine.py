@@ -0,0 +1,39 @@
+"""
+Prompt template tests.
+🧪 Variable injection, the cacheable prompt prefix and $variable handling.
+"""
+
+from unittest.mock import patch
+
+from app.services import template_engine
+from app.services.template_engine import TemplateEngine
+from app.services.anthropic_client import user_content
+
+from .conftest import TEST_CLIENT_ID
+
+
+def test_prompt_templates_inject_email_and_mark_cacheable_prefix(client_manager):
+    """Test that {variable} placeholders are filled and the static prefix is split off for caching"""
+    engine = TemplateEngine(client_manager)
+    email = {'from': 'jane@example.com', 'subject': 'Invoice question', 'stripped_text': 'Why was I charged twice?'}
+    
+    prompt = engine.compose_classification_prompt(TEST_CLIENT_ID, email)
+    assert '**Subject:** Invoice question' in prompt
+    assert '{body}' not in prompt
+    
+    with patch.object(template_engine, 'MIN_CACHEABLE_PROMPT_CHARS', 100):
+        prompt = engine.compose_classification_prompt(TEST_CLIENT_ID, email)
+    blocks = user_content(prompt)
+    assert blocks[0]['cache_control'] == {'type': 'ephemeral'}
+    assert 'jane@example.com' not in blocks[0]['text']
+    assert ''.join(block['text'] for block in blocks) == prompt
+
+
+def test_dollar_variables_fill_template_text_only(client_manager):
+    """Test that $variables are filled in the template text, never inside inserted email text"""
+    engine = TemplateEngine(client_manager)
+    
+    rendered = engine._render(TEST_CLIENT_ID, 'Cost: $$5, category $category. Email: {body}',
+                              {'category': 'billing', 'body': 'Refund $$5 for $category please'})
+    
+    assert rendered == 'Cost: $5, category billing. Email: Refund $$5 for $category please'
@@ -0,0 +1,23 @@
+"""
+Startup warm-up tests.
+🧪 The warm-up shared by the API server and the queue worker.
+"""
+
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from app.services import warmup
+from app.services.client_manager import get_client_manager
+
+
+@pytest.mark.anyio
+async def test_warm_caches_prepares_client_manager_and_anthropic():
+    """Test that the shared startup warm-up builds the domain mapping and opens Anthropic connections"""
+    with patch.object(warmup, 'warm_anthropic_connection', AsyncMock(return_value=True)) as warm, \
+         patch.object(warmup, 'start_connection_keepalive') as keepalive:
+        await warmup.warm_caches()
+    
+    assert get_client_manager()._initialized
+    warm.assert_awaited_once()
+    keepalive.assert_called_once()
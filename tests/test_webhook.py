@@ -3,8 +3,10 @@ Essential tests for MVP webhook endpoint.
 🧪 Tests core email processing functionality.
 """
 
+import asyncio
 import pytest
 import os
+from unittest.mock import AsyncMock, MagicMock, patch
 from fastapi.testclient import TestClient
 
 # Set test environment variables before importing app
@@ -13,6 +15,7 @@ os.environ["MAILGUN_API_KEY"] = "test-key"
 os.environ["MAILGUN_DOMAIN"] = "test.domain.com"
 
 from app.main import app
+from app.routers import webhooks
 
 client = TestClient(app)
 
@@ -35,6 +38,13 @@ def test_root_endpoint():
     assert data["status"] == "active"
     assert "/webhooks/mailgun/inbound" in data["webhook"]
 
+def test_webhook_status_reports_classification_stats():
+    """Test that the status endpoint exposes the trivial-email skip rate."""
+    response = client.get("/webhooks/status")
+    assert response.status_code == 200
+    stats = response.json()["classification"]
+    assert {"requests", "trivial_skips", "trivial_skip_rate"} <= stats.keys()
+
 def test_webhook_endpoint_valid_data():
     """Test Mailgun webhook endpoint with valid data."""
     form_data = {
@@ -51,6 +61,21 @@ def test_webhook_endpoint_valid_data():
     assert data["status"] == "received"
     assert "processing started" in data["message"]
 
+def test_webhook_endpoint_multipart_with_attachment():
+    """Test Mailgun webhook endpoint with a multipart body carrying an attachment."""
+    form_data = {
+        "from": "test@example.com",
+        "subject": "Invoice attached",
+        "body-plain": "Please see the attached invoice",
+        "recipient": "support@yourcompany.com"
+    }
+    files = {"attachment-1": ("invoice.pdf", b"%PDF-1.4" + b"0" * 50000, "application/pdf")}
+    
+    response = client.post("/webhooks/mailgun/inbound", data=form_data, files=files)
+    assert response.status_code == 200
+    data = response.json()
+    assert data["status"] == "received"
+
 def test_webhook_endpoint_missing_data():
     """Test webhook endpoint with minimal data."""
     form_data = {
@@ -73,4 +98,48 @@ def test_webhook_endpoint_empty_request():
 def test_docs_endpoint():
     """Test that API documentation is accessible."""
     response = client.get("/docs")
-    assert response.status_code == 200 
\ No newline at end of file
+    assert response.status_code == 200 
+
+@pytest.fixture
+def pipeline_deps():
+    """Client manager and classifier for a client with auto-reply off and team forwarding on."""
+    client_manager = MagicMock()
+    client_manager.get_client_config_optional.return_value.settings.auto_reply_enabled = False
+    client_manager.get_client_config_optional.return_value.settings.team_forwarding_enabled = True
+    client_manager.get_routing_rules.return_value.has_special_routing = False
+    client_manager.get_routing_rules.return_value.route_for.return_value = "support@example.com"
+    classifier = MagicMock()
+    classifier.classify_email = AsyncMock(return_value={"category": "support", "confidence": 0.9})
+    return client_manager, classifier
+
+@pytest.mark.anyio
+async def test_pipeline_skips_generation_for_disabled_auto_reply(pipeline_deps):
+    """Test that no acknowledgment is generated for clients with auto-reply turned off."""
+    client_manager, classifier = pipeline_deps
+    with patch.object(webhooks, "generate_customer_acknowledgment", AsyncMock()) as acknowledge, \
+         patch.object(webhooks, "generate_team_analysis", AsyncMock(return_value="analysis")), \
+         patch.object(webhooks, "forward_to_team", AsyncMock()) as forward:
+        await webhooks.process_email_pipeline({"subject": "Help"}, "acme", classifier, client_manager, MagicMock())
+    
+    acknowledge.assert_not_called()
+    forward.assert_awaited_once()
+
+@pytest.mark.anyio
+async def test_pipeline_slot_released_during_team_analysis(pipeline_deps):
+    """Test that a batched team analysis does not hold a pipeline concurrency slot."""
+    client_manager, classifier = pipeline_deps
+    slot = asyncio.Semaphore(1)
+    slot_free_during_analysis = []
+    
+    async def analyse(*args):
+        slot_free_during_analysis.append(not slot.locked())
+        return "analysis"
+    
+    with patch.object(webhooks, "generate_team_analysis", analyse), \
+         patch.object(webhooks, "forward_to_team", AsyncMock()) as forward:
+        await webhooks.process_email_pipeline(
+            {"subject": "Help"}, "acme", classifier, client_manager, MagicMock(), slot=slot
+        )
+    
+    forward.assert_awaited_once()
+    assert slot_free_during_analysis == [True]